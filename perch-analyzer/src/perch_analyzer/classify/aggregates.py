@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+import numpy as np
+
+DEFAULT_TOP_K = 100
+
+# fixed edges so histograms from different parts (and shards) can simply be summed,
+# plus an underflow and an overflow bin on either side
+HISTOGRAM_EDGES = np.round(np.arange(-20.0, 20.0 + 1e-6, 0.1), 1).astype(np.float32)
+NUM_HISTOGRAM_BINS = len(HISTOGRAM_EDGES) + 1
+
+MERGED_AGGREGATES_FILENAME = "aggregates.npz"
+
+
+def part_aggregates_filename(part_filename: str) -> str:
+    return part_filename.removesuffix(".parquet") + ".aggregates.npz"
+
+
+@dataclass
+class LabelAggregates:
+    """Per-label top-k windows and logit histograms of a classifier output.
+
+    `top_logits` and `top_window_ids` are [num_labels, top_k], sorted by descending
+    logit and padded with -inf / -1. `histogram` is [num_labels, NUM_HISTOGRAM_BINS],
+    where bin i counts logits in [HISTOGRAM_EDGES[i - 1], HISTOGRAM_EDGES[i]).
+    """
+
+    labels: list[str]
+    top_logits: np.ndarray
+    top_window_ids: np.ndarray
+    histogram: np.ndarray
+
+    @classmethod
+    def empty(cls, labels: Sequence[str], top_k: int = DEFAULT_TOP_K):
+        return cls(
+            labels=list(labels),
+            top_logits=np.full((len(labels), top_k), -np.inf, dtype=np.float32),
+            top_window_ids=np.full((len(labels), top_k), -1, dtype=np.int64),
+            histogram=np.zeros((len(labels), NUM_HISTOGRAM_BINS), dtype=np.int64),
+        )
+
+    @property
+    def top_k(self) -> int:
+        return self.top_logits.shape[1]
+
+    def _keep_top_k(self, logits: np.ndarray, window_ids: np.ndarray):
+        """Keeps the top_k columns of [num_labels, n] logits, row by row."""
+        if logits.shape[1] > self.top_k:
+            top_idx = np.argpartition(-logits, self.top_k - 1, axis=1)[:, : self.top_k]
+            logits = np.take_along_axis(logits, top_idx, axis=1)
+            window_ids = np.take_along_axis(window_ids, top_idx, axis=1)
+
+        order = np.argsort(-logits, axis=1, kind="stable")
+        self.top_logits = np.take_along_axis(logits, order, axis=1)
+        self.top_window_ids = np.take_along_axis(window_ids, order, axis=1)
+
+    def update(self, window_ids: np.ndarray, logits: np.ndarray):
+        """Adds a [num_windows, num_labels] batch of logits."""
+        logits = np.asarray(logits, dtype=np.float32).T
+        num_labels, num_windows = logits.shape
+
+        self._keep_top_k(
+            np.concatenate([self.top_logits, logits], axis=1),
+            np.concatenate(
+                [
+                    self.top_window_ids,
+                    np.broadcast_to(
+                        np.asarray(window_ids, dtype=np.int64),
+                        (num_labels, num_windows),
+                    ),
+                ],
+                axis=1,
+            ),
+        )
+
+        bins = np.searchsorted(HISTOGRAM_EDGES, logits, side="right")
+        flat_bins = bins + np.arange(num_labels)[:, None] * NUM_HISTOGRAM_BINS
+        self.histogram += np.bincount(
+            flat_bins.ravel(), minlength=num_labels * NUM_HISTOGRAM_BINS
+        ).reshape(num_labels, NUM_HISTOGRAM_BINS)
+
+    def merge(self, other: "LabelAggregates"):
+        if other.labels != self.labels:
+            raise ValueError("cannot merge aggregates with different labels")
+
+        self._keep_top_k(
+            np.concatenate([self.top_logits, other.top_logits], axis=1),
+            np.concatenate([self.top_window_ids, other.top_window_ids], axis=1),
+        )
+        self.histogram += other.histogram
+
+    def top_windows(
+        self, label: str, num_windows: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (window_ids, logits) of the highest logits for a label."""
+        label_idx = self.labels.index(label)
+        valid = self.top_window_ids[label_idx] >= 0
+        return (
+            self.top_window_ids[label_idx][valid][:num_windows],
+            self.top_logits[label_idx][valid][:num_windows],
+        )
+
+    def count_in_range(self, label: str, min_logit: float, max_logit: float) -> int:
+        """Counts windows with min_logit <= logit < max_logit for a label.
+
+        Exact when both bounds fall on HISTOGRAM_EDGES; otherwise the partially
+        covered bins at either end are included.
+        """
+        label_idx = self.labels.index(label)
+        first_bin = np.searchsorted(HISTOGRAM_EDGES, min_logit, side="right")
+        last_bin = np.searchsorted(HISTOGRAM_EDGES, max_logit, side="left")
+        return int(self.histogram[label_idx, first_bin : last_bin + 1].sum())
+
+    def save(self, path: str | Path):
+        with Path(path).open("wb") as f:
+            np.savez_compressed(
+                f,
+                labels=np.array(self.labels, dtype=str),
+                top_logits=self.top_logits,
+                top_window_ids=self.top_window_ids,
+                histogram=self.histogram,
+                histogram_edges=HISTOGRAM_EDGES,
+            )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "LabelAggregates":
+        with np.load(path) as data:
+            if not np.array_equal(data["histogram_edges"], HISTOGRAM_EDGES):
+                raise ValueError(f"{path} was written with different histogram edges")
+            return cls(
+                labels=data["labels"].tolist(),
+                top_logits=data["top_logits"],
+                top_window_ids=data["top_window_ids"],
+                histogram=data["histogram"],
+            )
+
+
+def merge_part_aggregates(
+    parts_dir: str | Path, part_filenames: Sequence[str]
+) -> LabelAggregates | None:
+    """Merges the aggregates written next to each of the given parts."""
+    merged: LabelAggregates | None = None
+    for part_filename in part_filenames:
+        path = Path(parts_dir) / part_aggregates_filename(part_filename)
+        if not path.exists():
+            return None
+        aggregates = LabelAggregates.load(path)
+        if merged is None:
+            merged = aggregates
+        else:
+            merged.merge(aggregates)
+    return merged
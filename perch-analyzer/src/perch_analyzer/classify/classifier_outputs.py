@@ -1,6 +1,36 @@
 from perch_analyzer.db import db
+from perch_analyzer.classify import aggregates, output_format
+from pathlib import Path
+from typing import Literal
 import polars as pl
 
+SamplingStrategy = Literal["random", "top"]
+
+
+def existing_classifier_output_windows(
+    analyzer_db: db.AnalyzerDB, classifier_output_id: int, label: str
+) -> pl.LazyFrame:
+    """Window ids already gathered for a classifier output and label."""
+    return (
+        analyzer_db.get_classifier_output_windows_frame(
+            classifier_output_id=classifier_output_id, label=label
+        )
+        .select("window_id")
+        .lazy()
+    )
+
+
+def insert_classifier_output_windows(
+    analyzer_db: db.AnalyzerDB, classifier_output_id: int, windows: pl.DataFrame
+):
+    """Bulk inserts a frame of (window_id, logit, label) rows."""
+    analyzer_db.insert_classifier_output_windows(
+        classifier_output_id=classifier_output_id,
+        window_ids=windows["window_id"].to_list(),
+        logits=windows["logit"].to_list(),
+        labels=windows["label"].cast(pl.String).to_list(),
+    )
+
 
 def gather_classifier_output_windows(
     analyzer_db: db.AnalyzerDB,
@@ -10,33 +40,217 @@ def gather_classifier_output_windows(
     label: str,
     num_windows: int,
 ):
+    """Gathers up to `num_windows` not yet gathered windows in a logit range.
+
+    The range is [min_logit, max_logit), as count_classifier_output_windows counts.
+    """
     classifier_outputs = analyzer_db.get_classifier_output(classifier_output_id)
 
     windows = (
         pl.scan_parquet(classifier_outputs.parquet_path)
         .filter(
             pl.col("label") == label,
-            pl.col("logit") > min_logit,
+            pl.col("logit") >= min_logit,
             pl.col("logit") < max_logit,
         )
+        .join(
+            existing_classifier_output_windows(
+                analyzer_db, classifier_output_id, label
+            ),
+            on="window_id",
+            how="anti",
+        )
+        .select("window_id", "logit", "label")
         .limit(num_windows)
         .collect()
     )
 
-    for window in windows.iter_rows(named=True):
-        window_id = window["window_id"]
-        logit = window["logit"]
-        label = window["label"]
+    insert_classifier_output_windows(analyzer_db, classifier_output_id, windows)
+
+
+def gather_stratified_classifier_output_windows(
+    analyzer_db: db.AnalyzerDB,
+    classifier_output_id: int,
+    labels: list[str] | None,
+    logit_edges: list[float],
+    num_per_bin: int,
+    strategy: SamplingStrategy = "random",
+    seed: int | None = None,
+) -> int:
+    """Gathers up to `num_per_bin` windows for every (label, logit bin) at once.
+
+    The bins are [logit_edges[i], logit_edges[i + 1]). Within each bin windows are
+    either sampled uniformly at random or the highest logits are taken. Everything
+    happens in a single lazy scan of the classifier output, and windows already
+    gathered for a label are skipped. Returns the number of windows gathered.
+    """
+    if len(logit_edges) < 2:
+        raise ValueError("logit_edges needs at least two edges")
+    logit_edges = sorted(logit_edges)
+
+    classifier_output = analyzer_db.get_classifier_output(classifier_output_id)
+
+    existing = (
+        analyzer_db.get_classifier_output_windows_frame(classifier_output_id)
+        .select("window_id", "label")
+        .lazy()
+    )
+
+    windows = pl.scan_parquet(classifier_output.parquet_path)
+    if labels is not None:
+        windows = windows.filter(pl.col("label").is_in(labels))
+
+    # index of the bin each logit falls into
+    logit_bin = pl.sum_horizontal(
+        pl.lit(0, dtype=pl.Int32),
+        *[(pl.col("logit") >= edge).cast(pl.Int32) for edge in logit_edges[1:-1]],
+    )
+
+    if strategy == "random":
+        in_sample = pl.int_range(pl.len()).shuffle(seed=seed) < num_per_bin
+    elif strategy == "top":
+        in_sample = pl.col("logit").rank("ordinal", descending=True) <= num_per_bin
+    else:
+        raise ValueError(f"unknown sampling strategy {strategy}")
+
+    windows = (
+        windows.filter(
+            pl.col("logit") >= logit_edges[0],
+            pl.col("logit") < logit_edges[-1],
+        )
+        .select("window_id", "logit", pl.col("label").cast(pl.String))
+        .join(existing, on=["window_id", "label"], how="anti")
+        .with_columns(logit_bin.alias("logit_bin"))
+        .filter(in_sample.over("label", "logit_bin"))
+        .collect()
+    )
+
+    insert_classifier_output_windows(analyzer_db, classifier_output_id, windows)
+    return windows.height
+
+
+def load_classifier_output_aggregates(
+    analyzer_db: db.AnalyzerDB, classifier_output_id: int
+) -> aggregates.LabelAggregates | None:
+    """Loads the per-label top-k and histogram aggregates of a classifier output.
+
+    Returns None for outputs written before aggregates existed. Once an output is
+    finished, the merged aggregates are cached in its parts directory.
+    """
+    classifier_output = analyzer_db.get_classifier_output(classifier_output_id)
+    merged_path = (
+        Path(classifier_output.parts_dir) / aggregates.MERGED_AGGREGATES_FILENAME
+    )
+
+    if merged_path.exists():
+        return aggregates.LabelAggregates.load(merged_path)
+
+    parts = analyzer_db.get_all_classifier_output_parts(classifier_output_id)
+    if not parts:
+        return None
+
+    merged = aggregates.merge_part_aggregates(
+        classifier_output.parts_dir, [part.filename for part in parts]
+    )
+    if merged is not None and classifier_output.finished:
+        merged.save(merged_path)
+    return merged
+
+
+def gather_top_classifier_output_windows(
+    analyzer_db: db.AnalyzerDB,
+    classifier_output_id: int,
+    label: str,
+    num_windows: int,
+):
+    """Gathers the highest-logit not yet gathered windows for a label.
+
+    The top windows come from the stored aggregates, over-fetched by the number
+    of windows already gathered so enough are left after removing those. When the
+    aggregates do not hold that many, the parquet is scanned instead.
+    """
+    label_aggregates = load_classifier_output_aggregates(
+        analyzer_db, classifier_output_id
+    )
+    existing = existing_classifier_output_windows(
+        analyzer_db, classifier_output_id, label
+    )
+    num_candidates = num_windows + existing.select(pl.len()).collect().item()
+
+    if label_aggregates is None or num_candidates > label_aggregates.top_k:
+        # fall back to scanning the parquet for the top logits
+        classifier_output = analyzer_db.get_classifier_output(classifier_output_id)
+        candidates = pl.scan_parquet(classifier_output.parquet_path).filter(
+            pl.col("label") == label
+        )
+    else:
+        window_ids, logits = label_aggregates.top_windows(label, num_candidates)
+        candidates = pl.LazyFrame(
+            {
+                "window_id": window_ids,
+                "logit": logits,
+                "label": [label] * len(window_ids),
+            },
+            schema={"window_id": pl.Int64, "logit": pl.Float32, "label": pl.String},
+        )
+
+    windows = (
+        candidates.join(existing, on="window_id", how="anti")
+        .top_k(num_windows, by="logit")
+        .select("window_id", "logit", "label")
+        .collect()
+    )
+
+    insert_classifier_output_windows(analyzer_db, classifier_output_id, windows)
+
+
+def count_classifier_output_windows(
+    analyzer_db: db.AnalyzerDB,
+    classifier_output_id: int,
+    label: str,
+    min_logit: float,
+    max_logit: float,
+    label_aggregates: aggregates.LabelAggregates | None = None,
+) -> int:
+    """Counts windows of a label with a logit in [min_logit, max_logit).
+
+    Uses the stored histograms when available (see LabelAggregates.count_in_range),
+    otherwise scans the parquet. Callers that already loaded the aggregates can
+    pass them in.
+    """
+    if label_aggregates is None:
+        label_aggregates = load_classifier_output_aggregates(
+            analyzer_db, classifier_output_id
+        )
+    if label_aggregates is not None:
+        return label_aggregates.count_in_range(label, min_logit, max_logit)
+
+    classifier_output = analyzer_db.get_classifier_output(classifier_output_id)
+    return (
+        pl.scan_parquet(classifier_output.parquet_path)
+        .filter(
+            pl.col("label") == label,
+            pl.col("logit") >= min_logit,
+            pl.col("logit") < max_logit,
+        )
+        .select(pl.len())
+        .collect()
+        .item()
+    )
+
 
-        if analyzer_db.get_all_classifier_output_windows(
-            classifier_output_id=classifier_output_id, window_id=window_id, label=label
-        ):
-            # skip adding duplicates
-            continue
+def get_dropped_row_counts(
+    analyzer_db: db.AnalyzerDB, classifier_output_id: int
+) -> dict[str, int]:
+    """Per-label number of rows a sparse classifier output did not write."""
+    classifier_output = analyzer_db.get_classifier_output(classifier_output_id)
+    parts = analyzer_db.get_all_classifier_output_parts(classifier_output_id)
 
-        analyzer_db.insert_classifier_output_window(
-            classifier_output_id=classifier_output_id,
-            window_id=window_id,
-            logit=logit,
-            label=label,
+    dropped_counts: dict[str, int] = {}
+    for part in parts:
+        part_counts = output_format.read_dropped_row_counts(
+            f"{classifier_output.parts_dir}/{part.filename}"
         )
+        for label, count in part_counts.items():
+            dropped_counts[label] = dropped_counts.get(label, 0) + count
+    return dropped_counts
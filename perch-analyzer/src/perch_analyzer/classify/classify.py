@@ -1,107 +1,388 @@
 import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
 from perch_hoplite.db.sqlite_usearch_impl import SQLiteUSearchDB
 from perch_hoplite.agile.classifier import batched_embedding_iterator
-from perch_analyzer.db.db import AnalyzerDB
-from ml_collections import config_dict
+from perch_analyzer.config import config
+from perch_analyzer.db.db import AnalyzerDB, ClassifierOutputPart
+from perch_analyzer.classify.window_metadata import WindowFilenameJoiner
+from perch_analyzer.classify import (
+    aggregates,
+    classifier_outputs,
+    output_format,
+    pipeline,
+)
 
 from tqdm import tqdm
 import numpy as np
-import pyarrow as pa
-import pyarrow.parquet as pq
 
 BATCH_SIZE = 32678
 
+PART_FILENAME_RE = re.compile(r"^part-(\d+)-(\d+)\.(parquet|aggregates\.npz)(\.tmp)?$")
+
+
+@dataclass
+class ClassifiedBatch:
+    window_ids: np.ndarray
+    logits: np.ndarray
+    filenames: np.ndarray
+    offsets: np.ndarray
+    aggregates: aggregates.LabelAggregates
+    keep_mask: np.ndarray | None
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """Shard `index` of `count` contiguous window id ranges."""
+
+    index: int
+    count: int
+
+    def __post_init__(self):
+        if not 0 <= self.index < self.count:
+            raise ValueError(
+                f"shard index must be in [0, {self.count}), got {self.index}"
+            )
+
+
+def shard_window_ids(window_ids: np.ndarray, shard: ShardSpec) -> np.ndarray:
+    """Splits sorted window ids into `shard.count` contiguous, equally sized ranges.
+
+    Every process (or SLURM array task) computes the same split as long as the
+    hoplite database does not change between them.
+    """
+    return np.array_split(window_ids, shard.count)[shard.index]
+
+
+def part_filename(start_window_id: int, end_window_id: int) -> str:
+    return f"part-{start_window_id:012d}-{end_window_id:012d}.parquet"
+
+
+def remaining_window_ids(
+    window_ids: np.ndarray, parts: list[ClassifierOutputPart]
+) -> np.ndarray:
+    """Returns the window ids not covered by any of the completed parts.
+
+    Parts may overlap or nest: a part written by a resumed run spans the gaps
+    between parts that were already complete.
+    """
+    if not parts:
+        return window_ids
+
+    starts = np.array([part.start_window_id for part in parts], dtype=np.int64)
+    ends = np.array([part.end_window_id for part in parts], dtype=np.int64)
+    order = np.argsort(starts)
+    starts, ends = starts[order], ends[order]
+    # the furthest end of any part starting at or before each start, so a window
+    # is covered if it is within the union of the parts starting before it
+    reach = np.maximum.accumulate(ends)
+
+    part_idx = np.searchsorted(starts, window_ids, side="right") - 1
+    covered = (part_idx >= 0) & (window_ids <= reach[np.maximum(part_idx, 0)])
+    return window_ids[~covered]
+
+
+def remove_unrecorded_parts(
+    parts_dir: Path,
+    parts: list[ClassifierOutputPart],
+    window_ids: np.ndarray,
+):
+    """Removes part files left behind by a run that died before recording them.
+
+    Only parts inside the range of `window_ids` are touched, so shards running
+    concurrently never remove each other's in-progress parts.
+    """
+    if len(window_ids) == 0:
+        return
+
+    recorded = {part.filename for part in parts}
+    recorded |= {aggregates.part_aggregates_filename(f) for f in recorded}
+    min_window_id, max_window_id = window_ids.min(), window_ids.max()
+    for path in parts_dir.iterdir():
+        match = PART_FILENAME_RE.match(path.name)
+        if not match or path.name in recorded:
+            continue
+        start_window_id, end_window_id = int(match[1]), int(match[2])
+        if start_window_id >= min_window_id and end_window_id <= max_window_id:
+            logging.info(f"removing unrecorded classifier output part {path}")
+            path.unlink()
+
 
 def classify(
     classifier_id: int,
     hoplite_db: SQLiteUSearchDB,
     analyzer_db: AnalyzerDB,
-):
+    workers: int = 1,
+    prefetch: int = 2,
+    classifier_output_id: int | None = None,
+    shard: ShardSpec | None = None,
+    top_k: int = aggregates.DEFAULT_TOP_K,
+    sparse: output_format.SparseOutputConfig | None = None,
+) -> int:
+    """Runs a classifier over every window in the hoplite database.
+
+    Reading embeddings, inference (logits and window metadata) and writing the
+    parquet file run as overlapping pipeline stages. `workers` is the number of
+    inference threads and `prefetch` the number of batches buffered between stages.
+
+    Each batch is written to its own parquet part and recorded against the
+    classifier output once it is complete. Passing the `classifier_output_id` of an
+    unfinished run resumes it, skipping the window id ranges already written.
+
+    With a `shard`, only that shard's window id range is classified and the output
+    is left unfinished; `finalize_classifier_output` marks it finished once every
+    shard is done.
+
+    Next to each part we also write the per-label top `top_k` windows and logit
+    histograms, so top-k and range-count queries don't need to re-read the parquet.
+
+    With an enabled `sparse` config only the qualifying (window, label) rows are
+    written; the number of dropped rows per label is recorded in each part's footer
+    and the aggregates still cover every logit.
+    """
     classifier = analyzer_db.get_classifier(classifier_id)
-    classifier_output_id = analyzer_db.insert_classifier_output(classifier_id)
+    if classifier_output_id is None:
+        classifier_output_id = analyzer_db.insert_classifier_output(classifier_id)
     classifier_output = analyzer_db.get_classifier_output(classifier_output_id)
 
+    if classifier_output.classifier_id != classifier_id:
+        raise ValueError(
+            f"classifier output {classifier_output_id} belongs to classifier {classifier_output.classifier_id}, not {classifier_id}"
+        )
+    if classifier_output.finished:
+        logging.info(f"classifier output {classifier_output_id} is already finished")
+        return classifier_output_id
+
     logging.debug(
         f"started to classify with classifier_id: {classifier_id}, classifier_output_id: {classifier_output_id}"
     )
 
     linear_model = classifier.linear_classifier
-    parquet_filepath = classifier_output.parquet_path
+    parts_dir = Path(classifier_output.parts_dir)
+    parts_dir.mkdir(exist_ok=True, parents=True)
 
-    window_ids = np.array(hoplite_db.match_window_ids())
+    window_ids = np.sort(np.array(hoplite_db.match_window_ids(), dtype=np.int64))
+    if shard is not None:
+        window_ids = shard_window_ids(window_ids, shard)
+        logging.info(
+            f"classifying shard {shard.index + 1}/{shard.count} with {len(window_ids)} windows"
+        )
 
-    arrow_schema = pa.schema(
-        [
-            pa.field("filename", pa.string()),
-            pa.field("logit", pa.float32()),
-            pa.field("timestamp_s", pa.float32()),
-            pa.field("window_id", pa.int64()),
-            pa.field("label", pa.string()),
-        ]
-    )
+    completed_parts = analyzer_db.get_all_classifier_output_parts(classifier_output_id)
+    remove_unrecorded_parts(parts_dir, completed_parts, window_ids)
+    window_ids = remaining_window_ids(window_ids, completed_parts)
+    if completed_parts:
+        logging.info(
+            f"resuming classifier output {classifier_output_id} from {len(completed_parts)} completed parts, {len(window_ids)} windows remaining"
+        )
 
     labels = linear_model.classes
     label_ids = {cl: i for i, cl in enumerate(linear_model.classes)}
     target_label_ids = np.array([label_ids[lab] for lab in labels])
 
-    writer = pq.ParquetWriter(parquet_filepath, arrow_schema, compression="zstd")
-
     def logits_fn(batch_embs: np.ndarray):
         return linear_model(batch_embs)[:, target_label_ids]
 
-    emb_iter = batched_embedding_iterator(hoplite_db, window_ids, batch_size=BATCH_SIZE)
+    def read_batches():
+        reader_db = hoplite_db.thread_split()
+        return batched_embedding_iterator(reader_db, window_ids, batch_size=BATCH_SIZE)
 
-    for batch_window_ids, batch_embs in tqdm(
-        emb_iter,
-        total=len(window_ids) // BATCH_SIZE,
-        desc="Classifying and writing",
-    ):
-        logits = np.asarray(logits_fn(batch_embs))
+    def make_worker():
+        window_joiner = WindowFilenameJoiner(hoplite_db.thread_split())
 
-        filenames: list[str] = []
-        offsets: list[float] = []
+        def classify_batch(batch: tuple[np.ndarray, np.ndarray]) -> ClassifiedBatch:
+            batch_window_ids, batch_embs = batch
+            logits = np.asarray(logits_fn(batch_embs))
 
-        windows = hoplite_db.get_all_windows(
-            filter=config_dict.create(isin=dict(id=list(batch_window_ids)))
-        )
+            if logits.shape[1] != len(labels):
+                raise ValueError(
+                    "Number of classes in the classifier does not match the number of labels"
+                )
 
-        recording_id_to_filename: dict[int, str] = {}
+            filenames, offsets = window_joiner.join(batch_window_ids)
 
-        recording_ids: set[int] = set([window.recording_id for window in windows])
+            batch_aggregates = aggregates.LabelAggregates.empty(labels, top_k)
+            batch_aggregates.update(batch_window_ids, logits)
 
-        for recording_id in recording_ids:
-            if recording_id not in recording_id_to_filename:
-                recording = hoplite_db.get_recording(recording_id)
-                recording_id_to_filename[recording_id] = recording.filename
+            keep_mask = None
+            if sparse is not None and sparse.enabled:
+                keep_mask = sparse.keep_mask(labels, logits)
 
-        for window in windows:
-            filenames.append(recording_id_to_filename[window.recording_id])
-            offsets.append(float(window.offsets[0]))
+            return ClassifiedBatch(
+                window_ids=batch_window_ids,
+                logits=logits,
+                filenames=filenames,
+                offsets=offsets,
+                aggregates=batch_aggregates,
+                keep_mask=keep_mask,
+            )
 
-        num_embeddings = logits.shape[0]
-        num_classes = logits.shape[1]
+        return classify_batch
 
-        if num_classes != len(labels):
-            raise ValueError(
-                "Number of classes in the classifier does not match the number of labels"
+    progress = tqdm(
+        total=-(-len(window_ids) // BATCH_SIZE),
+        desc="Classifying and writing",
+        position=shard.index if shard is not None else None,
+    )
+
+    def write_batch(batch: ClassifiedBatch):
+        start_window_id = int(batch.window_ids.min())
+        end_window_id = int(batch.window_ids.max())
+        filename = part_filename(start_window_id, end_window_id)
+
+        # write to a temporary file so a crash never leaves a truncated part
+        tmp_path = parts_dir / f"{filename}.tmp"
+        writer = output_format.open_writer(str(tmp_path), labels, sparse)
+        try:
+            output_format.write_label_partitioned_batch(
+                writer,
+                labels=labels,
+                logits=batch.logits,
+                window_ids=batch.window_ids,
+                filenames=batch.filenames,
+                offsets=batch.offsets,
+                keep_mask=batch.keep_mask,
             )
+            if batch.keep_mask is not None:
+                output_format.write_dropped_row_counts(
+                    writer, labels, (~batch.keep_mask).sum(axis=0)
+                )
+        finally:
+            writer.close()
+
+        aggregates_filename = aggregates.part_aggregates_filename(filename)
+        aggregates_tmp_path = parts_dir / f"{aggregates_filename}.tmp"
+        batch.aggregates.save(aggregates_tmp_path)
+
+        os.replace(aggregates_tmp_path, parts_dir / aggregates_filename)
+        os.replace(tmp_path, parts_dir / filename)
 
-        filenames_repeated = np.repeat(filenames, num_classes)
-        window_ids_repeated = np.repeat(batch_window_ids, num_classes)
-        offsets_repeated = np.repeat(offsets, num_classes).astype(np.float32)
-        logits_flat = logits.flatten().astype(np.float32)
-        labels_repeated = np.tile(labels, num_embeddings)
-
-        arrow_table = pa.table(
-            {
-                "filename": pa.array(filenames_repeated, type=pa.string()),
-                "logit": pa.array(logits_flat, type=pa.float32()),
-                "timestamp_s": pa.array(offsets_repeated, type=pa.float32()),
-                "window_id": pa.array(window_ids_repeated, type=pa.int64()),
-                "label": pa.array(labels_repeated, type=pa.string()),
-            },
-            schema=arrow_schema,
+        analyzer_db.insert_classifier_output_part(
+            classifier_output_id=classifier_output_id,
+            start_window_id=start_window_id,
+            end_window_id=end_window_id,
+            num_windows=len(batch.window_ids),
+            filename=filename,
         )
-        writer.write_table(arrow_table)
+        progress.update()
+
+    try:
+        pipeline.run_pipeline(
+            source=read_batches,
+            make_worker=make_worker,
+            sink=write_batch,
+            workers=workers,
+            prefetch=prefetch,
+        )
+    finally:
+        progress.close()
+
+    if shard is None:
+        analyzer_db.set_finish_classifier_output(classifier_output_id, True)
+        classifier_outputs.load_classifier_output_aggregates(
+            analyzer_db, classifier_output_id
+        )
+    return classifier_output_id
+
+
+def finalize_classifier_output(
+    hoplite_db: SQLiteUSearchDB,
+    analyzer_db: AnalyzerDB,
+    classifier_output_id: int,
+) -> int:
+    """Marks a sharded classifier output finished once its parts cover every window.
+
+    Returns the number of windows not covered by any part; if it is not zero the
+    output stays unfinished and can be completed by resuming it.
+    """
+    window_ids = np.sort(np.array(hoplite_db.match_window_ids(), dtype=np.int64))
+    parts = analyzer_db.get_all_classifier_output_parts(classifier_output_id)
+    num_missing = len(remaining_window_ids(window_ids, parts))
+
+    if num_missing == 0:
+        analyzer_db.set_finish_classifier_output(classifier_output_id, True)
+        classifier_outputs.load_classifier_output_aggregates(
+            analyzer_db, classifier_output_id
+        )
+    else:
+        logging.warning(
+            f"classifier output {classifier_output_id} is missing {num_missing} windows, resume it to finish"
+        )
+    return num_missing
+
+
+def _classify_shard(
+    conf: config.Config,
+    classifier_id: int,
+    classifier_output_id: int,
+    shard: ShardSpec,
+    workers: int,
+    prefetch: int,
+    top_k: int,
+    sparse: output_format.SparseOutputConfig | None,
+):
+    # each process opens its own database handles
+    hoplite_db = SQLiteUSearchDB.create(
+        str(Path(conf.data_path) / conf.hoplite_db_path)
+    )
+    classify(
+        classifier_id=classifier_id,
+        hoplite_db=hoplite_db,
+        analyzer_db=AnalyzerDB(conf),
+        workers=workers,
+        prefetch=prefetch,
+        classifier_output_id=classifier_output_id,
+        shard=shard,
+        top_k=top_k,
+        sparse=sparse,
+    )
+
+
+def classify_sharded(
+    conf: config.Config,
+    classifier_id: int,
+    hoplite_db: SQLiteUSearchDB,
+    analyzer_db: AnalyzerDB,
+    num_processes: int,
+    workers: int = 1,
+    prefetch: int = 2,
+    classifier_output_id: int | None = None,
+    top_k: int = aggregates.DEFAULT_TOP_K,
+    sparse: output_format.SparseOutputConfig | None = None,
+) -> int:
+    """Classifies `num_processes` contiguous window id shards in parallel processes.
+
+    All shards write their parts under one classifier output, which is finalized
+    once every process has finished.
+    """
+    if classifier_output_id is None:
+        classifier_output_id = analyzer_db.insert_classifier_output(classifier_id)
+
+    # spawn rather than fork so no sqlite connection is shared with the children
+    with ProcessPoolExecutor(
+        max_workers=num_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _classify_shard,
+                conf,
+                classifier_id,
+                classifier_output_id,
+                ShardSpec(index=i, count=num_processes),
+                workers,
+                prefetch,
+                top_k,
+                sparse,
+            )
+            for i in range(num_processes)
+        ]
+        for future in futures:
+            future.result()
 
-    writer.close()
+    finalize_classifier_output(hoplite_db, analyzer_db, classifier_output_id)
+    return classifier_output_id
@@ -0,0 +1,189 @@
+from dataclasses import asdict, dataclass, field
+from typing import Iterator, Sequence
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+LAYOUT_METADATA_KEY = b"perch_analyzer.layout"
+LABELS_METADATA_KEY = b"perch_analyzer.labels"
+SPARSE_METADATA_KEY = b"perch_analyzer.sparse"
+DROPPED_ROWS_METADATA_KEY = b"perch_analyzer.dropped_rows"
+
+# one row group per (batch, label), with `label` and `filename` dictionary-encoded,
+# so readers can skip row groups using the label and logit statistics
+LABEL_PARTITIONED_LAYOUT = b"label_partitioned_v1"
+
+
+@dataclass
+class SparseOutputConfig:
+    """Which (window, label) rows to write; everything else is only counted.
+
+    A row is kept if its logit is at least the label's minimum logit (falling back
+    to `min_logit`) and, with `top_labels_per_window`, the label is one of the
+    window's highest-scoring labels.
+    """
+
+    min_logit: float | None = None
+    label_min_logits: dict[str, float] = field(default_factory=dict)
+    top_labels_per_window: int | None = None
+
+    def __post_init__(self):
+        if self.top_labels_per_window is not None and self.top_labels_per_window < 1:
+            raise ValueError(
+                f"top_labels_per_window must be at least 1, got {self.top_labels_per_window}"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            self.min_logit is not None
+            or bool(self.label_min_logits)
+            or self.top_labels_per_window is not None
+        )
+
+    def keep_mask(self, labels: Sequence[str], logits: np.ndarray) -> np.ndarray:
+        """Returns a [num_windows, num_labels] mask of the rows to write."""
+        unknown_labels = set(self.label_min_logits) - set(labels)
+        if unknown_labels:
+            raise ValueError(
+                f"minimum logits given for labels not in the classifier: {sorted(unknown_labels)}"
+            )
+
+        default_min_logit = -np.inf if self.min_logit is None else self.min_logit
+        min_logits = np.array(
+            [self.label_min_logits.get(label, default_min_logit) for label in labels],
+            dtype=np.float32,
+        )
+        mask = logits >= min_logits[None, :]
+
+        k = self.top_labels_per_window
+        if k is not None and k < logits.shape[1]:
+            top_label_idx = np.argpartition(-logits, k - 1, axis=1)[:, :k]
+            top_mask = np.zeros_like(mask)
+            np.put_along_axis(top_mask, top_label_idx, True, axis=1)
+            mask &= top_mask
+
+        return mask
+
+
+def arrow_schema(
+    labels: Sequence[str], sparse: SparseOutputConfig | None = None
+) -> pa.Schema:
+    metadata = {
+        LAYOUT_METADATA_KEY: LABEL_PARTITIONED_LAYOUT,
+        LABELS_METADATA_KEY: json.dumps(list(labels)).encode(),
+    }
+    if sparse is not None and sparse.enabled:
+        metadata[SPARSE_METADATA_KEY] = json.dumps(asdict(sparse)).encode()
+
+    return pa.schema(
+        [
+            pa.field("filename", pa.dictionary(pa.int32(), pa.string())),
+            pa.field("logit", pa.float32()),
+            pa.field("timestamp_s", pa.float32()),
+            pa.field("window_id", pa.int64()),
+            pa.field("label", pa.dictionary(pa.int32(), pa.string())),
+        ],
+        metadata=metadata,
+    )
+
+
+def open_writer(
+    parquet_path: str,
+    labels: Sequence[str],
+    sparse: SparseOutputConfig | None = None,
+) -> pq.ParquetWriter:
+    return pq.ParquetWriter(
+        parquet_path,
+        arrow_schema(labels, sparse),
+        compression="zstd",
+        write_statistics=True,
+    )
+
+
+def label_partitioned_tables(
+    schema: pa.Schema,
+    labels: Sequence[str],
+    logits: np.ndarray,
+    window_ids: np.ndarray,
+    filenames: np.ndarray,
+    offsets: np.ndarray,
+    keep_mask: np.ndarray | None = None,
+) -> Iterator[pa.Table]:
+    """Splits a [num_windows, num_labels] batch of logits into one table per label.
+
+    `filenames` is aligned with `window_ids`; it is dictionary-encoded once for the
+    whole batch and shared between the per-label tables. With a `keep_mask`, only
+    the masked rows are emitted and labels without any rows are skipped.
+    """
+    num_windows = logits.shape[0]
+
+    unique_filenames, filename_indices = np.unique(filenames, return_inverse=True)
+    filename_column = pa.DictionaryArray.from_arrays(
+        pa.array(filename_indices.astype(np.int32)),
+        pa.array(unique_filenames, type=pa.string()),
+    )
+    offsets_column = pa.array(np.asarray(offsets, dtype=np.float32))
+    window_ids_column = pa.array(np.asarray(window_ids, dtype=np.int64))
+    label_indices = pa.array(np.zeros(num_windows, dtype=np.int32))
+
+    for label_idx, label in enumerate(labels):
+        table = pa.table(
+            {
+                "filename": filename_column,
+                "logit": pa.array(logits[:, label_idx].astype(np.float32)),
+                "timestamp_s": offsets_column,
+                "window_id": window_ids_column,
+                "label": pa.DictionaryArray.from_arrays(
+                    label_indices, pa.array([label], type=pa.string())
+                ),
+            },
+            schema=schema,
+        )
+
+        if keep_mask is not None:
+            rows = np.flatnonzero(keep_mask[:, label_idx])
+            if len(rows) == 0:
+                continue
+            table = table.take(pa.array(rows))
+
+        yield table
+
+
+def write_label_partitioned_batch(
+    writer: pq.ParquetWriter,
+    labels: Sequence[str],
+    logits: np.ndarray,
+    window_ids: np.ndarray,
+    filenames: np.ndarray,
+    offsets: np.ndarray,
+    keep_mask: np.ndarray | None = None,
+):
+    for table in label_partitioned_tables(
+        writer.schema, labels, logits, window_ids, filenames, offsets, keep_mask
+    ):
+        # each label gets its own row group so min/max statistics stay tight
+        writer.write_table(table, row_group_size=table.num_rows)
+
+
+def write_dropped_row_counts(
+    writer: pq.ParquetWriter, labels: Sequence[str], dropped_counts: np.ndarray
+):
+    """Records how many rows per label a sparse output left out, in the file footer."""
+    writer.add_key_value_metadata(
+        {
+            DROPPED_ROWS_METADATA_KEY: json.dumps(
+                {label: int(count) for label, count in zip(labels, dropped_counts)}
+            )
+        }
+    )
+
+
+def read_dropped_row_counts(parquet_path: str) -> dict[str, int]:
+    """Reads the per-label dropped row counts of a part; empty for dense outputs."""
+    metadata = pq.read_metadata(parquet_path).metadata or {}
+    dropped_counts = metadata.get(DROPPED_ROWS_METADATA_KEY)
+    if dropped_counts is None:
+        return {}
+    return json.loads(dropped_counts)
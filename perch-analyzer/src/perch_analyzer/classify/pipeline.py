@@ -0,0 +1,105 @@
+from typing import Any, Callable, Iterable
+import queue
+import threading
+
+# how long a blocked stage waits before checking whether the pipeline was stopped
+POLL_INTERVAL_S = 0.1
+
+_DONE = object()
+
+
+class _Pipeline:
+    def __init__(self, prefetch: int):
+        self.read_queue: queue.Queue = queue.Queue(maxsize=prefetch)
+        self.write_queue: queue.Queue = queue.Queue(maxsize=prefetch)
+        self.stopped = threading.Event()
+        self.errors: list[BaseException] = []
+
+    def put(self, q: queue.Queue, item: Any) -> bool:
+        while not self.stopped.is_set():
+            try:
+                q.put(item, timeout=POLL_INTERVAL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q: queue.Queue) -> Any:
+        while not self.stopped.is_set():
+            try:
+                return q.get(timeout=POLL_INTERVAL_S)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def thread(self, target: Callable[[], None], name: str) -> threading.Thread:
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                self.errors.append(e)
+                self.stopped.set()
+
+        return threading.Thread(target=run, name=name, daemon=True)
+
+
+def run_pipeline(
+    source: Callable[[], Iterable[Any]],
+    make_worker: Callable[[], Callable[[Any], Any]],
+    sink: Callable[[Any], None],
+    workers: int = 1,
+    prefetch: int = 2,
+):
+    """Runs source -> worker -> sink with each stage on its own thread(s).
+
+    `source` is called on the reader thread and `make_worker` once on each worker
+    thread, so both can open thread-local resources (e.g. `thread_split()` hoplite
+    handles). `sink` is only ever called from the single writer thread. The queues
+    between the stages hold at most `prefetch` items each, which bounds memory
+    when one stage is slower than the others.
+
+    The first exception raised by any stage stops the pipeline and is re-raised.
+    """
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    if prefetch < 1:
+        raise ValueError(f"prefetch must be at least 1, got {prefetch}")
+
+    pipeline = _Pipeline(prefetch)
+
+    def read():
+        for item in source():
+            if not pipeline.put(pipeline.read_queue, item):
+                return
+        for _ in range(workers):
+            pipeline.put(pipeline.read_queue, _DONE)
+
+    def work():
+        process = make_worker()
+        while (item := pipeline.get(pipeline.read_queue)) is not _DONE:
+            if not pipeline.put(pipeline.write_queue, process(item)):
+                return
+        pipeline.put(pipeline.write_queue, _DONE)
+
+    def write():
+        remaining_workers = workers
+        while remaining_workers:
+            item = pipeline.get(pipeline.write_queue)
+            if item is _DONE:
+                if pipeline.stopped.is_set():
+                    return
+                remaining_workers -= 1
+                continue
+            sink(item)
+
+    threads = [pipeline.thread(read, "pipeline-reader")]
+    threads += [pipeline.thread(work, f"pipeline-worker-{i}") for i in range(workers)]
+    threads.append(pipeline.thread(write, "pipeline-writer"))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if pipeline.errors:
+        raise pipeline.errors[0]
@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+from perch_hoplite.db.sqlite_usearch_impl import SQLiteUSearchDB
+import numpy as np
+
+# hoplite stores window offsets as a raw float64 blob
+# (see scripts/transfer_to_new_hoplite.py)
+OFFSETS_DTYPE = np.float64
+
+
+@dataclass
+class RecordingFilenames:
+    """recording_id -> filename lookup table, sorted by recording id."""
+
+    recording_ids: np.ndarray
+    filenames: np.ndarray
+
+    @classmethod
+    def load(cls, hoplite_db: SQLiteUSearchDB) -> "RecordingFilenames":
+        cursor = hoplite_db._get_cursor()
+        cursor.execute("SELECT id, filename FROM recordings ORDER BY id")
+        rows = cursor.fetchall()
+
+        recording_ids = np.fromiter(
+            (row[0] for row in rows), dtype=np.int64, count=len(rows)
+        )
+        filenames = np.array([row[1] for row in rows], dtype=object)
+
+        return cls(recording_ids=recording_ids, filenames=filenames)
+
+    def indices(self, recording_ids: np.ndarray) -> np.ndarray:
+        """Returns the position of each recording id in this table."""
+        positions = np.searchsorted(self.recording_ids, recording_ids)
+        positions = np.minimum(positions, len(self.recording_ids) - 1)
+
+        if len(self.recording_ids) == 0 or np.any(
+            self.recording_ids[positions] != recording_ids
+        ):
+            raise KeyError("recording ids are missing from the recording table")
+
+        return positions
+
+
+@dataclass
+class WindowMetadata:
+    """Columnar (window_id, recording_id, offset) metadata for a batch of windows."""
+
+    window_ids: np.ndarray
+    recording_ids: np.ndarray
+    offsets: np.ndarray
+
+
+def fetch_window_metadata(
+    hoplite_db: SQLiteUSearchDB, window_ids: np.ndarray
+) -> WindowMetadata:
+    """Fetches the recording id and start offset of each window in a single query.
+
+    The returned arrays are aligned with `window_ids`. Since batches of window ids
+    are (nearly) contiguous, we scan the primary key range and join in NumPy rather
+    than binding one parameter per window.
+    """
+    window_ids = np.asarray(window_ids, dtype=np.int64)
+    if len(window_ids) == 0:
+        return WindowMetadata(
+            window_ids=window_ids,
+            recording_ids=np.zeros(0, dtype=np.int64),
+            offsets=np.zeros(0, dtype=np.float32),
+        )
+
+    cursor = hoplite_db._get_cursor()
+    # CAST skips any registered converter so we get the raw offsets bytes
+    cursor.execute(
+        """
+        SELECT id, recording_id, CAST(substr(offsets, 1, ?) AS BLOB)
+        FROM windows
+        WHERE id BETWEEN ? AND ?
+        ORDER BY id
+        """,
+        (
+            np.dtype(OFFSETS_DTYPE).itemsize,
+            int(window_ids.min()),
+            int(window_ids.max()),
+        ),
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        raise KeyError("window ids are missing from the hoplite database")
+
+    db_window_ids, db_recording_ids, db_offsets = zip(*rows)
+    db_window_ids = np.asarray(db_window_ids, dtype=np.int64)
+    db_recording_ids = np.asarray(db_recording_ids, dtype=np.int64)
+    db_offsets = np.frombuffer(b"".join(db_offsets), dtype=OFFSETS_DTYPE)
+
+    positions = np.searchsorted(db_window_ids, window_ids)
+    positions = np.minimum(positions, len(db_window_ids) - 1)
+    if np.any(db_window_ids[positions] != window_ids):
+        raise KeyError("window ids are missing from the hoplite database")
+
+    return WindowMetadata(
+        window_ids=window_ids,
+        recording_ids=db_recording_ids[positions],
+        offsets=db_offsets[positions].astype(np.float32),
+    )
+
+
+class WindowFilenameJoiner:
+    """Joins window ids to (filename, offset), caching the recording table for a run."""
+
+    def __init__(self, hoplite_db: SQLiteUSearchDB):
+        self.hoplite_db = hoplite_db
+        self.recordings = RecordingFilenames.load(hoplite_db)
+
+    def recording_indices(self, recording_ids: np.ndarray) -> np.ndarray:
+        try:
+            return self.recordings.indices(recording_ids)
+        except KeyError:
+            # recordings may have been added since the table was loaded
+            self.recordings = RecordingFilenames.load(self.hoplite_db)
+            return self.recordings.indices(recording_ids)
+
+    def join(self, window_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (filenames, offsets) aligned with `window_ids`."""
+        metadata = fetch_window_metadata(self.hoplite_db, window_ids)
+        recording_indices = self.recording_indices(metadata.recording_ids)
+        return self.recordings.filenames[recording_indices], metadata.offsets
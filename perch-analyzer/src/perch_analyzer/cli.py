@@ -5,7 +5,14 @@ from perch_analyzer.embed import embed
 from perch_analyzer.target_recordings import target_recordings
 from perch_analyzer.db import db
 from perch_analyzer.search import search
-from perch_analyzer.classify import classifier, classify, classifier_outputs
+from perch_analyzer.classify import (
+    aggregates,
+    classifier,
+    classify,
+    classifier_outputs,
+    output_format,
+)
+from perch_analyzer.examine import precompute
 from perch_analyzer.gui import gui_loader
 from perch_hoplite.db import sqlite_usearch_impl
 import logging
@@ -28,6 +35,23 @@ def check_init_and_raise_error(data_dir: Path):
     setup_logging(data_dir)
 
 
+def parse_label_min_logits(values: list[str]) -> dict[str, float]:
+    label_min_logits: dict[str, float] = {}
+    for value in values:
+        label, sep, min_logit = value.rpartition("=")
+        if not sep or not label:
+            raise ValueError(f"expected label=min_logit, got {value}")
+        label_min_logits[label] = float(min_logit)
+    return label_min_logits
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Perch Analyzer - Bird call analysis toolkit"
@@ -73,6 +97,11 @@ def main():
     search_parser = subparsers.add_parser("search", help="Search recordings")
     search_parser.add_argument("--data_dir", type=Path, required=True)
     search_parser.add_argument("--num_per_target_recording", type=int, default=5)
+    search_parser.add_argument(
+        "--include_finished",
+        action="store_true",
+        help="search again with target recordings that were already searched",
+    )
 
     # Create classifier subcommand
     create_classifier_parser = subparsers.add_parser(
@@ -96,6 +125,84 @@ def main():
     )
     run_classifier_parser.add_argument("--data_dir", type=Path, required=True)
     run_classifier_parser.add_argument("--classifier_id", type=int, required=True)
+    run_classifier_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of threads computing logits and window metadata",
+    )
+    run_classifier_parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="number of batches buffered between the read, inference and write stages",
+    )
+    run_classifier_parser.add_argument(
+        "--classifier_output_id",
+        type=int,
+        default=None,
+        help="resume an unfinished classifier output instead of starting a new one",
+    )
+    run_classifier_parser.add_argument(
+        "--num_processes",
+        type=int,
+        default=1,
+        help="number of processes, each classifying a contiguous range of windows",
+    )
+    run_classifier_parser.add_argument(
+        "--top_k",
+        type=int,
+        default=aggregates.DEFAULT_TOP_K,
+        help="number of highest logit windows kept per label for fast top-k queries",
+    )
+    run_classifier_parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=None,
+        help="only classify one of this many window ranges (e.g. one per SLURM array task), requires --shard_index and --classifier_output_id",
+    )
+    run_classifier_parser.add_argument("--shard_index", type=int, default=None)
+    run_classifier_parser.add_argument(
+        "--min_logit",
+        type=float,
+        default=None,
+        help="only write (window, label) rows with at least this logit",
+    )
+    run_classifier_parser.add_argument(
+        "--label_min_logits",
+        nargs="*",
+        type=str,
+        default=[],
+        help="per-label minimum logits as label=min_logit, overriding --min_logit",
+    )
+    run_classifier_parser.add_argument(
+        "--top_labels_per_window",
+        type=positive_int,
+        default=None,
+        help="only write the highest scoring labels of each window",
+    )
+
+    # Create classifier output subcommand
+    create_classifier_output_parser = subparsers.add_parser(
+        "create_classifier_output",
+        help="Create an empty classifier output to be filled by sharded run_classifier jobs",
+    )
+    create_classifier_output_parser.add_argument("--data_dir", type=Path, required=True)
+    create_classifier_output_parser.add_argument(
+        "--classifier_id", type=int, required=True
+    )
+
+    # Finalize classifier output subcommand
+    finalize_classifier_output_parser = subparsers.add_parser(
+        "finalize_classifier_output",
+        help="Mark a sharded classifier output finished once all shards are done",
+    )
+    finalize_classifier_output_parser.add_argument(
+        "--data_dir", type=Path, required=True
+    )
+    finalize_classifier_output_parser.add_argument(
+        "--classifier_output_id", type=int, required=True
+    )
 
     # Set Xeno-canto API key subcommand
     set_xc_api_key_parser = subparsers.add_parser(
@@ -116,13 +223,82 @@ def main():
         "--classifier_output_id", type=int, required=True
     )
     gather_classifier_outputs_parser.add_argument(
-        "--min_logit", type=float, required=True
+        "--min_logit", type=float, default=None
     )
     gather_classifier_outputs_parser.add_argument(
-        "--max_logit", type=float, required=True
+        "--max_logit", type=float, default=None
     )
     gather_classifier_outputs_parser.add_argument("--label", type=str, required=True)
     gather_classifier_outputs_parser.add_argument("--num_windows", type=int, default=1)
+    gather_classifier_outputs_parser.add_argument(
+        "--top",
+        action="store_true",
+        help="gather the highest logit windows for the label instead of a logit range",
+    )
+
+    # Gather stratified classifier outputs subcommand
+    gather_stratified_parser = subparsers.add_parser(
+        "gather_stratified_classifier_outputs",
+        help="Gather outputs from classifier outputs for many labels and logit bins at once",
+    )
+    gather_stratified_parser.add_argument("--data_dir", type=Path, required=True)
+    gather_stratified_parser.add_argument(
+        "--classifier_output_id", type=int, required=True
+    )
+    gather_stratified_parser.add_argument(
+        "--labels",
+        nargs="*",
+        type=str,
+        default=None,
+        help="labels to gather, defaults to every label in the classifier output",
+    )
+    gather_stratified_parser.add_argument(
+        "--logit_edges",
+        nargs="+",
+        type=float,
+        required=True,
+        help="edges of the logit bins, e.g. -2 0 2 4 6 for four bins",
+    )
+    gather_stratified_parser.add_argument("--num_per_bin", type=int, default=1)
+    gather_stratified_parser.add_argument(
+        "--strategy",
+        type=str,
+        choices=["random", "top"],
+        default="random",
+        help="sample each bin uniformly at random or take its highest logits",
+    )
+    gather_stratified_parser.add_argument("--seed", type=int, default=None)
+
+    # Precompute windows subcommand
+    precompute_windows_parser = subparsers.add_parser(
+        "precompute_windows",
+        help="Render window audio and spectrograms ahead of reviewing them in the GUI",
+    )
+    precompute_windows_parser.add_argument("--data_dir", type=Path, required=True)
+    precompute_windows_source = precompute_windows_parser.add_mutually_exclusive_group(
+        required=True
+    )
+    precompute_windows_source.add_argument(
+        "--pending_annotations",
+        action="store_true",
+        help="windows of possible examples waiting on the Annotate page",
+    )
+    precompute_windows_source.add_argument(
+        "--classifier_output_id",
+        type=int,
+        help="windows gathered from this classifier output",
+    )
+    precompute_windows_source.add_argument(
+        "--label",
+        type=str,
+        help="windows annotated as positive for this label",
+    )
+    precompute_windows_parser.add_argument(
+        "--workers",
+        type=int,
+        default=precompute.PRECOMPUTE_WORKERS,
+        help="number of processes rendering windows",
+    )
 
     # Parse arguments
     args = parser.parse_args()
@@ -197,6 +373,7 @@ def main():
             db=analyzer_db,
             hoplite_db=hoplite_db,
             num_per_target_recording=args.num_per_target_recording,
+            include_finished=args.include_finished,
         )
 
         logger.info("finished searching recordings!")
@@ -235,15 +412,89 @@ def main():
         )
         logger = logging.getLogger(__name__)
 
+        sparse = output_format.SparseOutputConfig(
+            min_logit=args.min_logit,
+            label_min_logits=parse_label_min_logits(args.label_min_logits),
+            top_labels_per_window=args.top_labels_per_window,
+        )
+
         logger.info("running classifier!")
         print("running classifier!")
-        classify.classify(
-            classifier_id=args.classifier_id,
+        if args.num_shards is not None:
+            if args.shard_index is None or args.classifier_output_id is None:
+                raise ValueError(
+                    "--num_shards requires --shard_index and --classifier_output_id"
+                )
+            classify.classify(
+                classifier_id=args.classifier_id,
+                hoplite_db=hoplite_db,
+                analyzer_db=analyzer_db,
+                workers=args.workers,
+                prefetch=args.prefetch,
+                classifier_output_id=args.classifier_output_id,
+                shard=classify.ShardSpec(index=args.shard_index, count=args.num_shards),
+                top_k=args.top_k,
+                sparse=sparse,
+            )
+        elif args.num_processes > 1:
+            classify.classify_sharded(
+                conf=conf,
+                classifier_id=args.classifier_id,
+                hoplite_db=hoplite_db,
+                analyzer_db=analyzer_db,
+                num_processes=args.num_processes,
+                workers=args.workers,
+                prefetch=args.prefetch,
+                classifier_output_id=args.classifier_output_id,
+                top_k=args.top_k,
+                sparse=sparse,
+            )
+        else:
+            classify.classify(
+                classifier_id=args.classifier_id,
+                hoplite_db=hoplite_db,
+                analyzer_db=analyzer_db,
+                workers=args.workers,
+                prefetch=args.prefetch,
+                classifier_output_id=args.classifier_output_id,
+                top_k=args.top_k,
+                sparse=sparse,
+            )
+        logger.info("done running classifier")
+        print("done running classifier")
+    if args.module == "create_classifier_output":
+        check_init_and_raise_error(args.data_dir)
+        conf = config.Config.load(args.data_dir)
+        analyzer_db = db.AnalyzerDB(conf)
+        classifier_output_id = analyzer_db.insert_classifier_output(args.classifier_id)
+        logger = logging.getLogger(__name__)
+
+        logger.info(f"created classifier output {classifier_output_id}")
+        print(classifier_output_id)
+    if args.module == "finalize_classifier_output":
+        check_init_and_raise_error(args.data_dir)
+        conf = config.Config.load(args.data_dir)
+        analyzer_db = db.AnalyzerDB(conf)
+        hoplite_db = sqlite_usearch_impl.SQLiteUSearchDB.create(
+            str(Path(conf.data_path) / conf.hoplite_db_path)
+        )
+        num_missing = classify.finalize_classifier_output(
             hoplite_db=hoplite_db,
             analyzer_db=analyzer_db,
+            classifier_output_id=args.classifier_output_id,
         )
-        logger.info("done running classifier")
-        print("done running classifier")
+        logger = logging.getLogger(__name__)
+
+        if num_missing:
+            logger.info(
+                f"classifier output {args.classifier_output_id} is missing {num_missing} windows"
+            )
+            print(
+                f"classifier output {args.classifier_output_id} is missing {num_missing} windows, resume it with run_classifier --classifier_output_id={args.classifier_output_id}"
+            )
+        else:
+            logger.info(f"finalized classifier output {args.classifier_output_id}")
+            print(f"finalized classifier output {args.classifier_output_id}")
     if args.module == "set_xc_api_key":
         check_init_and_raise_error(args.data_dir)
         conf = config.Config.load(args.data_dir)
@@ -258,18 +509,82 @@ def main():
         check_init_and_raise_error(args.data_dir)
         conf = config.Config.load(args.data_dir)
         analyzer_db = db.AnalyzerDB(conf)
-        classifier_outputs.gather_classifier_output_windows(
+        if args.top:
+            classifier_outputs.gather_top_classifier_output_windows(
+                analyzer_db=analyzer_db,
+                classifier_output_id=args.classifier_output_id,
+                label=args.label,
+                num_windows=args.num_windows,
+            )
+        else:
+            if args.min_logit is None or args.max_logit is None:
+                raise ValueError(
+                    "--min_logit and --max_logit are required without --top"
+                )
+            classifier_outputs.gather_classifier_output_windows(
+                analyzer_db=analyzer_db,
+                classifier_output_id=args.classifier_output_id,
+                min_logit=args.min_logit,
+                max_logit=args.max_logit,
+                label=args.label,
+                num_windows=args.num_windows,
+            )
+        logger = logging.getLogger(__name__)
+
+        logger.info("successfully gathered target recordings")
+        print("successfully gathered target recordings")
+    if args.module == "gather_stratified_classifier_outputs":
+        check_init_and_raise_error(args.data_dir)
+        conf = config.Config.load(args.data_dir)
+        analyzer_db = db.AnalyzerDB(conf)
+        num_gathered = classifier_outputs.gather_stratified_classifier_output_windows(
             analyzer_db=analyzer_db,
             classifier_output_id=args.classifier_output_id,
-            min_logit=args.min_logit,
-            max_logit=args.max_logit,
-            label=args.label,
-            num_windows=args.num_windows,
+            labels=args.labels or None,
+            logit_edges=args.logit_edges,
+            num_per_bin=args.num_per_bin,
+            strategy=args.strategy,
+            seed=args.seed,
         )
         logger = logging.getLogger(__name__)
 
-        logger.info("successfully gathered target recordings")
-        print("successfully gathered target recordings")
+        logger.info(f"successfully gathered {num_gathered} classifier output windows")
+        print(f"successfully gathered {num_gathered} classifier output windows")
+    if args.module == "precompute_windows":
+        check_init_and_raise_error(args.data_dir)
+        conf = config.Config.load(args.data_dir)
+        analyzer_db = db.AnalyzerDB(conf)
+        hoplite_db = sqlite_usearch_impl.SQLiteUSearchDB.create(
+            str(Path(conf.data_path) / conf.hoplite_db_path)
+        )
+        logger = logging.getLogger(__name__)
+
+        if args.pending_annotations:
+            window_ids = precompute.pending_annotation_window_ids(
+                analyzer_db, hoplite_db
+            )
+        elif args.classifier_output_id is not None:
+            window_ids = precompute.classifier_output_window_ids(
+                analyzer_db, args.classifier_output_id
+            )
+        else:
+            window_ids = precompute.labeled_window_ids(hoplite_db, args.label)
+
+        logger.info(f"precomputing {len(window_ids)} windows")
+        print(f"precomputing {len(window_ids)} windows")
+        stats = precompute.precompute_windows(
+            config=conf,
+            hoplite_db=hoplite_db,
+            window_ids=window_ids,
+            workers=args.workers,
+        )
+
+        logger.info("done precomputing windows!")
+        print(
+            f"rendered {stats.num_rendered} windows in {stats.elapsed_s:.1f}s "
+            f"({stats.windows_per_s:.1f} windows/s), {stats.num_skipped} were "
+            f"already rendered, {stats.num_failed} failed"
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+from ml_collections import config_dict
+from pathlib import Path
+from perch_hoplite.agile import classifier
+import json
+import numpy as np
+
+# bump when the header or weights layout changes
+FORMAT_VERSION = 1
+
+
+def save_linear_classifier(
+    linear_classifier: classifier.LinearClassifier,
+    weights_path: str,
+    header_path: str,
+):
+    """Saves the weights as a raw .npy array and everything else as a JSON header.
+
+    The header is written last, so a classifier only counts as saved once its
+    header exists.
+    """
+    beta = np.ascontiguousarray(linear_classifier.beta, dtype=np.float32)
+    np.save(weights_path, beta)
+
+    embedding_model_config = linear_classifier.embedding_model_config
+    header = {
+        "format_version": FORMAT_VERSION,
+        "shape": list(beta.shape),
+        "classes": list(linear_classifier.classes),
+        "beta_bias": np.asarray(linear_classifier.beta_bias, dtype=np.float32).tolist(),
+        # a JSON string, as LinearClassifier.save writes it
+        "embedding_model_config": None
+        if embedding_model_config is None
+        else embedding_model_config.to_json(),
+    }
+    tmp_header_path = f"{header_path}.tmp"
+    with open(tmp_header_path, "w") as f:
+        json.dump(header, f)
+    Path(tmp_header_path).replace(header_path)
+
+
+def load_linear_classifier(
+    weights_path: str, header_path: str
+) -> classifier.LinearClassifier:
+    """Loads a classifier saved by `save_linear_classifier`, memory-mapping the weights."""
+    with open(header_path) as f:
+        header = json.load(f)
+    if header["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"{header_path} has format version {header['format_version']}, expected {FORMAT_VERSION}"
+        )
+
+    beta = np.load(weights_path, mmap_mode="r")
+    if list(beta.shape) != header["shape"]:
+        raise ValueError(
+            f"{weights_path} has shape {beta.shape}, expected {header['shape']}"
+        )
+
+    embedding_model_config = header["embedding_model_config"]
+    # early headers stored the config as a dict rather than a JSON string
+    if isinstance(embedding_model_config, str):
+        embedding_model_config = json.loads(embedding_model_config)
+    return classifier.LinearClassifier(
+        beta=beta,
+        beta_bias=np.asarray(header["beta_bias"], dtype=np.float32),
+        classes=tuple(header["classes"]),
+        embedding_model_config=None
+        if embedding_model_config is None
+        else config_dict.ConfigDict(embedding_model_config),
+    )
+
+
+def load_or_convert_linear_classifier(
+    weights_path: str, header_path: str, legacy_json_path: str
+) -> classifier.LinearClassifier:
+    """Loads the binary classifier, converting a legacy JSON classifier on first use."""
+    if Path(header_path).exists():
+        return load_linear_classifier(weights_path, header_path)
+
+    linear_classifier = classifier.LinearClassifier.load(legacy_json_path)
+    try:
+        save_linear_classifier(linear_classifier, weights_path, header_path)
+    except OSError:
+        # e.g. a read-only data directory, just keep using the JSON classifier
+        return linear_classifier
+    return load_linear_classifier(weights_path, header_path)
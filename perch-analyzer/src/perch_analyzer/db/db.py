@@ -1,35 +1,165 @@
-from sqlalchemy import create_engine, select
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import perch_analyzer.db.tables as tables
+from perch_analyzer.db import classifier_store, migrations
+from perch_analyzer.db.engine import BEGIN_IMMEDIATE, create_sqlite_engine
 from perch_hoplite import audio_io
+from perch_hoplite.db.sqlite_usearch_impl import SQLiteUSearchDB
+from ml_collections import config_dict
 from pydantic import BaseModel, ConfigDict
-from datetime import datetime as dt
-from typing import Any
+from datetime import datetime as dt, timedelta
+from functools import cached_property, lru_cache
+from pathlib import Path
+from typing import Any, Iterator, Literal, Sequence
+from contextlib import contextmanager
+import threading
+import hashlib
 from perch_hoplite.agile import classifier
 from perch_analyzer.config import config
 import numpy as np
+import polars as pl
 from scipy.io import wavfile
 
 
 SAMPLE_RATE = 32000
 
+# linear classifiers kept in memory by load_linear_classifier
+CLASSIFIER_CACHE_SIZE = 8
+
+HEADLINE_METRICS = ("roc_auc", "cmap", "top1_acc")
+
+# ids bound per IN (...) query, well below sqlite's variable limit
+QUERY_CHUNK_SIZE = 10_000
+
+# a claimed review queue item goes back to the queue after this long
+REVIEW_CLAIM_TIMEOUT_S = 30 * 60
+
+# id of the single review_queue_sync row
+REVIEW_QUEUE_SYNC_ID = 1
+
+# queue orders: best search score first, by label then score, or by recording
+ReviewQueueOrder = Literal["score", "label", "recording"]
+
 
 def linear_classifier_path(classifiers_dir: str, classifier_id: int):
+    """The JSON classifier written before the binary format, only read."""
     return f"{classifiers_dir}/{classifier_id}_classifier.json"
 
 
+def linear_classifier_weights_path(classifiers_dir: str, classifier_id: int):
+    return f"{classifiers_dir}/{classifier_id}_classifier.npy"
+
+
+def linear_classifier_header_path(classifiers_dir: str, classifier_id: int):
+    return f"{classifiers_dir}/{classifier_id}_classifier_header.json"
+
+
 def metrics_path(classifiers_dir: str, classifier_id: int):
     return f"{classifiers_dir}/{classifier_id}_metrics.npz"
 
 
+@lru_cache(maxsize=CLASSIFIER_CACHE_SIZE)
+def load_linear_classifier(
+    weights_path: str, header_path: str, legacy_json_path: str
+) -> classifier.LinearClassifier:
+    """Loads a linear classifier; files are never rewritten, so the paths are the key."""
+    return classifier_store.load_or_convert_linear_classifier(
+        weights_path, header_path, legacy_json_path
+    )
+
+
+def headline_metrics(metrics: Any) -> dict[str, float | None]:
+    """Picks the scalar HEADLINE_METRICS out of a metrics dict or npz file."""
+    headline: dict[str, float | None] = {}
+    for name in HEADLINE_METRICS:
+        value = metrics.get(name)
+        if value is not None and np.size(value) == 1:
+            headline[name] = float(np.asarray(value))
+        else:
+            headline[name] = None
+    return headline
+
+
 def classifier_output_path(classifier_outputs_dir: str, classifier_output_id: int):
     return f"{classifier_outputs_dir}/{classifier_output_id}.parquet"
 
 
+def classifier_output_parts_dir(classifier_outputs_dir: str, classifier_output_id: int):
+    return f"{classifier_outputs_dir}/{classifier_output_id}"
+
+
+def classifier_output_scan_path(classifier_outputs_dir: str, classifier_output_id: int):
+    """Path (or glob) to pass to pl.scan_parquet for a classifier output.
+
+    Outputs are written as parts in their own directory; outputs from before that
+    are a single parquet file.
+    """
+    single_file = classifier_output_path(classifier_outputs_dir, classifier_output_id)
+    if Path(single_file).exists():
+        return single_file
+    parts_dir = classifier_output_parts_dir(
+        classifier_outputs_dir, classifier_output_id
+    )
+    return f"{parts_dir}/*.parquet"
+
+
 def get_target_recording_path(target_recordings_dir: str, target_recording_id: int):
+    """Path of a target recording inserted before audio was stored by hash."""
     return f"{target_recordings_dir}/{target_recording_id}.wav"
 
 
+def get_target_recording_hash_path(target_recordings_dir: str, audio_hash: str):
+    return f"{target_recordings_dir}/{audio_hash}.wav"
+
+
+def target_audio_hash(audio: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(audio, dtype=np.float32)).hexdigest()
+
+
+def match_annotation_windows(
+    hoplite_db: SQLiteUSearchDB, annotations_where: str, params: Sequence[Any] = ()
+) -> list[tuple[int, int, int, str]]:
+    """Matches hoplite annotations to the windows they label.
+
+    Returns (annotation_id, window_id, recording_id, label) of the annotations
+    matching `annotations_where`, a condition on the annotations table, in
+    annotation id order. Annotations are joined to windows on recording and
+    byte-identical offsets in one query; the few whose offsets differ by float
+    error fall back to hoplite's approximate match, one query each. Annotations
+    matching no window, or more than one, are left out.
+    """
+    cursor = hoplite_db._get_cursor()
+    cursor.execute(
+        f"""
+        SELECT annotations.id, windows.id, annotations.recording_id, annotations.label
+        FROM annotations LEFT JOIN windows
+            ON windows.recording_id = annotations.recording_id
+            AND windows.offsets = annotations.offsets
+        WHERE {annotations_where}
+        ORDER BY annotations.id
+        """,
+        tuple(params),
+    )
+
+    matches: list[tuple[int, int, int, str]] = []
+    for annotation_id, window_id, recording_id, label in cursor.fetchall():
+        if window_id is None:
+            annotation = hoplite_db.get_annotation(annotation_id)
+            windows = hoplite_db.get_all_windows(
+                filter=config_dict.create(
+                    eq=dict(recording_id=recording_id),
+                    approx=dict(offsets=annotation.offsets),
+                )
+            )
+            if len(windows) != 1:
+                continue
+            window_id = windows[0].id
+        matches.append((annotation_id, window_id, recording_id, label))
+    return matches
+
+
 class ClassifierOutputWindow(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
@@ -40,9 +170,7 @@ class ClassifierOutputWindow(BaseModel):
     logit: float
 
 
-class Classifier(BaseModel):
-    model_config = ConfigDict(arbitrary_types_allowed=True)
-
+class ClassifierSummary(BaseModel):
     id: int
     datetime: dt
     embedding_model: str
@@ -53,14 +181,83 @@ class Classifier(BaseModel):
     learning_rate: float
     weak_neg_rate: float
     num_train_steps: float
-    metrics: dict[str, Any]  # TODO: make this an object, not a dict
-    linear_classifier: classifier.LinearClassifier
+    roc_auc: float | None
+    cmap: float | None
+    top1_acc: float | None
+
+
+CLASSIFIER_OUTPUT_WINDOWS_SCHEMA = {
+    "id": pl.Int64,
+    "classifier_output_id": pl.Int64,
+    "window_id": pl.Int64,
+    "label": pl.String,
+    "logit": pl.Float32,
+}
+
+
+class Classifier(ClassifierSummary):
+    """A classifier whose model and metrics are only loaded when accessed."""
+
+    linear_classifier_weights_path: str
+    linear_classifier_header_path: str
+    linear_classifier_path: str
+    metrics_path: str
+
+    @cached_property
+    def metrics(self) -> dict[str, Any]:  # TODO: make this an object, not a dict
+        with np.load(self.metrics_path) as metrics:
+            return dict(metrics)
+
+    @property
+    def linear_classifier(self) -> classifier.LinearClassifier:
+        return load_linear_classifier(
+            self.linear_classifier_weights_path,
+            self.linear_classifier_header_path,
+            self.linear_classifier_path,
+        )
 
 
 class ClassifierOutput(BaseModel):
     id: int
     classifier_id: int
     parquet_path: str
+    parts_dir: str
+    finished: bool
+
+
+class ClassifierOutputPart(BaseModel):
+    id: int
+    classifier_output_id: int
+    start_window_id: int
+    end_window_id: int
+    num_windows: int
+    filename: str
+
+
+def load_target_recording_audio(path: str) -> np.ndarray:
+    """Loads a target recording as float32 audio at SAMPLE_RATE.
+
+    Target recordings are written as float32 wavs at SAMPLE_RATE, which are
+    memory-mapped instead of decoded; anything else goes through audio_io.
+    """
+    try:
+        sample_rate, audio = wavfile.read(path, mmap=True)
+    except ValueError:
+        return audio_io.load_audio_file(path, SAMPLE_RATE)
+
+    if sample_rate != SAMPLE_RATE or audio.dtype != np.float32 or audio.ndim != 1:
+        return audio_io.load_audio_file(path, SAMPLE_RATE)
+    return audio
+
+
+class ReviewQueueItem(BaseModel):
+    id: int
+    annotation_id: int
+    window_id: int
+    recording_id: int
+    label: str
+    priority: float
+    claimed_by: str | None
 
 
 class TargetRecording(BaseModel):
@@ -70,51 +267,122 @@ class TargetRecording(BaseModel):
     xc_id: int | None
     filename: str | None
     label: str
-    audio: np.ndarray
+    audio_hash: str | None
+    path: str
+
+    @cached_property
+    def audio(self) -> np.ndarray:
+        """The recording's audio, only loaded on first access."""
+        return load_target_recording_audio(self.path)
 
 
 class AnalyzerDB:
     def __init__(self, config: config.Config):
         self.config = config
-        self.engine = create_engine(f"sqlite:///{config.data_path}/{config.db_path}")
+        self.engine = create_sqlite_engine(f"{config.data_path}/{config.db_path}")
         tables.Base.metadata.create_all(self.engine)
+        migrations.add_missing_columns(self.engine)
+        migrations.add_missing_indexes(self.engine)
+
+        # the connection of the batch (if any) each thread is in
+        self._local = threading.local()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Runs every call made on this thread inside a single transaction.
+
+        Calls commit to a savepoint instead of the database, and everything is
+        committed (or rolled back, on an exception) when the block exits. The
+        write lock is taken up front, so keep batches short. Nested batches join
+        the outer one.
+        """
+        if getattr(self._local, "connection", None) is not None:
+            yield
+            return
+
+        with self.engine.connect() as connection:
+            connection.info[BEGIN_IMMEDIATE] = True
+            with connection.begin():
+                self._local.connection = connection
+                try:
+                    yield
+                finally:
+                    self._local.connection = None
+
+    def _session(self) -> Session:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return Session(self.engine)
+        return Session(bind=connection, join_transaction_mode="create_savepoint")
+
+    def _classifier_summary_fields(
+        self, db_classifier: tables.Classifier
+    ) -> dict[str, Any]:
+        return dict(
+            id=db_classifier.id,
+            datetime=dt.fromisoformat(db_classifier.datetime),
+            embedding_model=db_classifier.embedding_model,
+            labels=list(db_classifier.labels),
+            num_train_steps=db_classifier.num_train_steps,
+            learning_rate=db_classifier.learning_rate,
+            rng=db_classifier.rng,
+            train_ratio=db_classifier.train_ratio,
+            max_train_examples_per_label=db_classifier.max_train_examples_per_label,
+            weak_neg_rate=db_classifier.weak_neg_rate,
+            roc_auc=db_classifier.roc_auc,
+            cmap=db_classifier.cmap,
+            top1_acc=db_classifier.top1_acc,
+        )
+
+    def _backfill_headline_metrics(
+        self, session: Session, db_classifiers: Sequence[tables.Classifier]
+    ):
+        """Copies headline metrics of classifiers inserted before they were stored.
+
+        Each classifier's metrics file is read at most once; classifiers without
+        one, or without some of the metrics, keep None for them.
+        """
+        classifiers_dir = f"{self.config.data_path}/{self.config.classifiers_dir}"
+        backfilled = False
+        for db_classifier in db_classifiers:
+            if db_classifier.headline_metrics_stored:
+                continue
+            path = metrics_path(classifiers_dir, db_classifier.id)
+            if Path(path).exists():
+                with np.load(path) as metrics:
+                    for name, value in headline_metrics(metrics).items():
+                        setattr(db_classifier, name, value)
+            db_classifier.headline_metrics_stored = True
+            backfilled = True
+
+        if backfilled:
+            session.commit()
+
+    def _classifier(self, db_classifier: tables.Classifier) -> Classifier:
+        classifiers_dir = f"{self.config.data_path}/{self.config.classifiers_dir}"
+        return Classifier(
+            **self._classifier_summary_fields(db_classifier),
+            linear_classifier_weights_path=linear_classifier_weights_path(
+                classifiers_dir, db_classifier.id
+            ),
+            linear_classifier_header_path=linear_classifier_header_path(
+                classifiers_dir, db_classifier.id
+            ),
+            linear_classifier_path=linear_classifier_path(
+                classifiers_dir, db_classifier.id
+            ),
+            metrics_path=metrics_path(classifiers_dir, db_classifier.id),
+        )
 
     def get_classifier(self, classifier_id: int) -> Classifier:
-        with Session(self.engine) as session:
+        with self._session() as session:
             stmt = select(tables.Classifier).where(
                 tables.Classifier.id == classifier_id
             )
             db_classifier = session.execute(stmt).scalar_one()
+            self._backfill_headline_metrics(session, [db_classifier])
 
-            # now we load the metrics and linear_classifier based on the id
-            linear_classifier = classifier.LinearClassifier.load(
-                linear_classifier_path(
-                    f"{self.config.data_path}/{self.config.classifiers_dir}",
-                    classifier_id,
-                )
-            )
-
-            metrics = np.load(
-                metrics_path(
-                    f"{self.config.data_path}/{self.config.classifiers_dir}",
-                    classifier_id,
-                )
-            )
-
-            return Classifier(
-                id=classifier_id,
-                datetime=dt.fromisoformat(db_classifier.datetime),
-                embedding_model=db_classifier.embedding_model,
-                linear_classifier=linear_classifier,
-                metrics=metrics,
-                labels=list(db_classifier.labels),
-                num_train_steps=db_classifier.num_train_steps,
-                learning_rate=db_classifier.learning_rate,
-                rng=db_classifier.rng,
-                train_ratio=db_classifier.train_ratio,
-                max_train_examples_per_label=db_classifier.max_train_examples_per_label,
-                weak_neg_rate=db_classifier.weak_neg_rate,
-            )
+            return self._classifier(db_classifier)
 
     def insert_classifier(
         self,
@@ -130,7 +398,7 @@ class AnalyzerDB:
         metrics: dict[str, Any],  # TODO: make this an object, not a dict
         linear_classifier: classifier.LinearClassifier,
     ) -> int:
-        with Session(self.engine) as session:
+        with self._session() as session:
             db_classifier = tables.Classifier(
                 datetime=datetime.isoformat(),
                 embedding_model=embedding_model,
@@ -141,6 +409,7 @@ class AnalyzerDB:
                 learning_rate=learning_rate,
                 weak_neg_rate=weak_neg_rate,
                 num_train_steps=num_train_steps,
+                **headline_metrics(metrics),
             )
 
             session.add(db_classifier)
@@ -149,11 +418,16 @@ class AnalyzerDB:
             classifier_id = db_classifier.id
 
             # Save the classifier and metrics files
-            linear_classifier.save(
-                linear_classifier_path(
+            classifier_store.save_linear_classifier(
+                linear_classifier,
+                linear_classifier_weights_path(
                     f"{self.config.data_path}/{self.config.classifiers_dir}",
                     classifier_id,
-                )
+                ),
+                linear_classifier_header_path(
+                    f"{self.config.data_path}/{self.config.classifiers_dir}",
+                    classifier_id,
+                ),
             )
             np.savez(
                 metrics_path(
@@ -166,66 +440,56 @@ class AnalyzerDB:
             session.commit()
             return classifier_id
 
-    def get_all_classifiers(self):
-        with Session(self.engine) as session:
+    def get_all_classifiers(self) -> list[Classifier]:
+        with self._session() as session:
             stmt = select(tables.Classifier)
             db_classifiers = session.execute(stmt).scalars().all()
+            self._backfill_headline_metrics(session, db_classifiers)
 
-            classifiers: list[Classifier] = []
+            return [self._classifier(db_classifier) for db_classifier in db_classifiers]
 
-            for db_classifier in db_classifiers:
-                linear_classifier = classifier.LinearClassifier.load(
-                    linear_classifier_path(
-                        f"{self.config.data_path}/{self.config.classifiers_dir}",
-                        db_classifier.id,
-                    )
-                )
-
-                metrics = np.load(
-                    metrics_path(
-                        f"{self.config.data_path}/{self.config.classifiers_dir}",
-                        db_classifier.id,
-                    )
-                )
-
-                classifiers.append(
-                    Classifier(
-                        id=db_classifier.id,
-                        datetime=dt.fromisoformat(db_classifier.datetime),
-                        embedding_model=db_classifier.embedding_model,
-                        linear_classifier=linear_classifier,
-                        metrics=metrics,
-                        labels=db_classifier.labels,
-                        num_train_steps=db_classifier.num_train_steps,
-                        learning_rate=db_classifier.learning_rate,
-                        rng=db_classifier.rng,
-                        train_ratio=db_classifier.train_ratio,
-                        max_train_examples_per_label=db_classifier.max_train_examples_per_label,
-                        weak_neg_rate=db_classifier.weak_neg_rate,
-                    )
-                )
+    def get_all_classifier_summaries(self) -> list[ClassifierSummary]:
+        """Lists classifiers from SQL alone, newest first."""
+        with self._session() as session:
+            stmt = select(tables.Classifier).order_by(tables.Classifier.id.desc())
+            db_classifiers = session.execute(stmt).scalars().all()
+            self._backfill_headline_metrics(session, db_classifiers)
 
-            return classifiers
+            return [
+                ClassifierSummary(**self._classifier_summary_fields(db_classifier))
+                for db_classifier in db_classifiers
+            ]
 
     def get_classifier_output(self, classifier_output_id: int) -> ClassifierOutput:
-        with Session(self.engine) as session:
+        with self._session() as session:
             stmt = select(tables.ClassifierOutput).where(
                 tables.ClassifierOutput.id == classifier_output_id
             )
 
             db_classifier_output = session.execute(stmt).scalar_one()
 
-            return ClassifierOutput(
-                id=classifier_output_id,
-                classifier_id=db_classifier_output.classifier_id,
-                parquet_path=classifier_output_path(
-                    f"{self.config.data_path}/{self.config.classifier_outputs_dir}",
-                    classifier_output_id,
-                ),
-            )
+            return self._classifier_output(db_classifier_output)
+
+    def _classifier_output(
+        self, db_classifier_output: tables.ClassifierOutput
+    ) -> ClassifierOutput:
+        classifier_outputs_dir = (
+            f"{self.config.data_path}/{self.config.classifier_outputs_dir}"
+        )
+        return ClassifierOutput(
+            id=db_classifier_output.id,
+            classifier_id=db_classifier_output.classifier_id,
+            parquet_path=classifier_output_scan_path(
+                classifier_outputs_dir, db_classifier_output.id
+            ),
+            parts_dir=classifier_output_parts_dir(
+                classifier_outputs_dir, db_classifier_output.id
+            ),
+            finished=db_classifier_output.finished,
+        )
 
     def insert_classifier_output(self, classifier_id: int) -> int:
-        with Session(self.engine) as session:
+        with self._session() as session:
             db_classifier_output = tables.ClassifierOutput(classifier_id=classifier_id)
 
             session.add(db_classifier_output)
@@ -237,7 +501,7 @@ class AnalyzerDB:
             return db_classifier_output.id
 
     def get_all_classifier_outputs(self, classifier_id: int) -> list[ClassifierOutput]:
-        with Session(self.engine) as session:
+        with self._session() as session:
             stmt = select(tables.ClassifierOutput).where(
                 tables.ClassifierOutput.classifier_id == classifier_id
             )
@@ -247,42 +511,118 @@ class AnalyzerDB:
             classifier_outputs: list[ClassifierOutput] = []
 
             for db_classifier_output in db_classifier_outputs:
-                classifier_outputs.append(
-                    ClassifierOutput(
-                        id=db_classifier_output.id,
-                        classifier_id=db_classifier_output.classifier_id,
-                        parquet_path=classifier_output_path(
-                            f"{self.config.data_path}/{self.config.classifier_outputs_dir}",
-                            db_classifier_output.id,
-                        ),
-                    )
-                )
+                classifier_outputs.append(self._classifier_output(db_classifier_output))
 
             return classifier_outputs
 
+    def set_finish_classifier_output(self, classifier_output_id: int, finished: bool):
+        with self._session() as session:
+            stmt = select(tables.ClassifierOutput).where(
+                tables.ClassifierOutput.id == classifier_output_id
+            )
+            db_classifier_output = session.execute(stmt).scalar_one()
+            db_classifier_output.finished = finished
+            session.commit()
+
+            return db_classifier_output.id
+
+    def insert_classifier_output_part(
+        self,
+        classifier_output_id: int,
+        start_window_id: int,
+        end_window_id: int,
+        num_windows: int,
+        filename: str,
+    ) -> int:
+        with self._session() as session:
+            db_classifier_output_part = tables.ClassifierOutputPart(
+                classifier_output_id=classifier_output_id,
+                start_window_id=start_window_id,
+                end_window_id=end_window_id,
+                num_windows=num_windows,
+                filename=filename,
+            )
+
+            session.add(db_classifier_output_part)
+            session.flush()
+            session.commit()
+
+            return db_classifier_output_part.id
+
+    def get_all_classifier_output_parts(
+        self, classifier_output_id: int
+    ) -> list[ClassifierOutputPart]:
+        with self._session() as session:
+            stmt = (
+                select(tables.ClassifierOutputPart)
+                .where(
+                    tables.ClassifierOutputPart.classifier_output_id
+                    == classifier_output_id
+                )
+                .order_by(tables.ClassifierOutputPart.start_window_id)
+            )
+
+            db_classifier_output_parts = session.execute(stmt).scalars().all()
+
+            return [
+                ClassifierOutputPart(
+                    id=db_part.id,
+                    classifier_output_id=db_part.classifier_output_id,
+                    start_window_id=db_part.start_window_id,
+                    end_window_id=db_part.end_window_id,
+                    num_windows=db_part.num_windows,
+                    filename=db_part.filename,
+                )
+                for db_part in db_classifier_output_parts
+            ]
+
+    def _target_recording(
+        self, db_target_recording: tables.TargetRecording
+    ) -> TargetRecording:
+        target_recordings_dir = (
+            f"{self.config.data_path}/{self.config.target_recordings_dir}"
+        )
+        if db_target_recording.audio_hash is None:
+            path = get_target_recording_path(
+                target_recordings_dir, db_target_recording.id
+            )
+        else:
+            path = get_target_recording_hash_path(
+                target_recordings_dir, db_target_recording.audio_hash
+            )
+
+        return TargetRecording(
+            id=db_target_recording.id,
+            xc_id=db_target_recording.xc_id,
+            filename=db_target_recording.filename,
+            label=db_target_recording.label,
+            audio_hash=db_target_recording.audio_hash,
+            path=path,
+        )
+
     def get_target_recording(self, target_recording_id: int) -> TargetRecording:
-        with Session(self.engine) as session:
+        with self._session() as session:
             stmt = select(tables.TargetRecording).where(
                 tables.TargetRecording.id == target_recording_id
             )
 
             db_target_recording = session.execute(stmt).scalar_one()
 
-            audio = audio_io.load_audio_file(
-                get_target_recording_path(
-                    f"{self.config.data_path}/{self.config.target_recordings_dir}",
-                    target_recording_id,
-                ),
-                SAMPLE_RATE,
+            return self._target_recording(db_target_recording)
+
+    def _find_target_recording_id(
+        self, session: Session, xc_id: int | None, label: str, audio_hash: str
+    ) -> int | None:
+        condition = (tables.TargetRecording.audio_hash == audio_hash) & (
+            tables.TargetRecording.label == label
+        )
+        if xc_id is not None:
+            condition |= (tables.TargetRecording.xc_id == xc_id) & (
+                tables.TargetRecording.label == label
             )
 
-            return TargetRecording(
-                id=db_target_recording.id,
-                xc_id=db_target_recording.xc_id,
-                filename=db_target_recording.filename,
-                label=db_target_recording.label,
-                audio=audio,
-            )
+        stmt = select(tables.TargetRecording.id).where(condition).limit(1)
+        return session.execute(stmt).scalar_one_or_none()
 
     def insert_target_recording(
         self,
@@ -290,34 +630,61 @@ class AnalyzerDB:
         filename: str | None,
         label: str,
         audio: np.ndarray,
-    ):
-        with Session(self.engine) as session:
+    ) -> int:
+        """Inserts a target recording, or returns the id of an identical one.
+
+        A target recording is identical if it has the same label and either the
+        same audio or the same xeno-canto id. The audio is stored as float32 under
+        its hash, once for all labels sharing it.
+        """
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        audio_hash = target_audio_hash(audio)
+
+        with self._session() as session:
+            existing_id = self._find_target_recording_id(
+                session, xc_id, label, audio_hash
+            )
+            if existing_id is not None:
+                return existing_id
+
+            path = Path(
+                get_target_recording_hash_path(
+                    f"{self.config.data_path}/{self.config.target_recordings_dir}",
+                    audio_hash,
+                )
+            )
+            if not path.exists():
+                tmp_path = path.with_suffix(".wav.tmp")
+                wavfile.write(tmp_path, SAMPLE_RATE, audio)
+                tmp_path.replace(path)
+
             db_target_recording = tables.TargetRecording(
                 xc_id=xc_id,
                 filename=filename,
                 label=label,
+                audio_hash=audio_hash,
             )
-
             session.add(db_target_recording)
-            session.flush()
 
-            wavfile.write(
-                get_target_recording_path(
-                    f"{self.config.data_path}/{self.config.target_recordings_dir}",
-                    db_target_recording.id,
-                ),
-                SAMPLE_RATE,
-                audio,
-            )
-
-            session.commit()
+            try:
+                session.commit()
+            except IntegrityError:
+                # inserted concurrently by another process
+                session.rollback()
+                existing_id = self._find_target_recording_id(
+                    session, xc_id, label, audio_hash
+                )
+                if existing_id is None:
+                    raise
+                return existing_id
 
             return db_target_recording.id
 
     def get_all_target_recordings(
         self, include_finished: bool
     ) -> list[TargetRecording]:
-        with Session(self.engine) as session:
+        """Lists target recordings; their audio is only loaded when accessed."""
+        with self._session() as session:
             stmt = select(tables.TargetRecording)
 
             if not include_finished:
@@ -325,41 +692,109 @@ class AnalyzerDB:
 
             db_target_recordings = session.execute(stmt).scalars().all()
 
-            target_recordings: list[TargetRecording] = []
+            return [
+                self._target_recording(db_target_recording)
+                for db_target_recording in db_target_recordings
+            ]
 
-            for db_target_recording in db_target_recordings:
-                audio = audio_io.load_audio_file(
-                    get_target_recording_path(
-                        f"{self.config.data_path}/{self.config.target_recordings_dir}",
-                        db_target_recording.id,
-                    ),
-                    SAMPLE_RATE,
-                )
+    def get_all_target_recording_xc_ids(self, label: str | None = None) -> set[int]:
+        """Returns the xeno-canto ids of all target recordings that have one."""
+        with self._session() as session:
+            stmt = select(tables.TargetRecording.xc_id).where(
+                tables.TargetRecording.xc_id.is_not(None)
+            )
 
-                target_recordings.append(
-                    TargetRecording(
-                        id=db_target_recording.id,
-                        xc_id=db_target_recording.xc_id,
-                        filename=db_target_recording.filename,
-                        label=db_target_recording.label,
-                        audio=audio,
+            if label is not None:
+                stmt = stmt.where(tables.TargetRecording.label == label)
+
+            return set(session.execute(stmt).scalars().all())
+
+    def get_target_recording_embeddings(
+        self, target_recording_ids: Sequence[int], embedding_model: str
+    ) -> dict[int, np.ndarray]:
+        """Returns the cached embeddings of target recordings, keyed by their id."""
+        with self._session() as session:
+            stmt = select(
+                tables.TargetRecordingEmbedding.target_recording_id,
+                tables.TargetRecordingEmbedding.embedding,
+            ).where(
+                tables.TargetRecordingEmbedding.embedding_model == embedding_model,
+                tables.TargetRecordingEmbedding.target_recording_id.in_(
+                    [int(x) for x in target_recording_ids]
+                ),
+            )
+
+            return {
+                target_recording_id: np.frombuffer(embedding, dtype=np.float32)
+                for target_recording_id, embedding in session.execute(stmt).all()
+            }
+
+    def insert_target_recording_embeddings(
+        self,
+        target_recording_ids: Sequence[int],
+        embedding_model: str,
+        embeddings: np.ndarray,
+    ):
+        """Caches [num_target_recordings, embedding_dim] embeddings, keeping existing ones."""
+        if len(target_recording_ids) != len(embeddings):
+            raise ValueError(
+                "target_recording_ids and embeddings must have the same length"
+            )
+        if len(target_recording_ids) == 0:
+            return
+
+        with self._session() as session:
+            session.execute(
+                sqlite_insert(tables.TargetRecordingEmbedding).on_conflict_do_nothing(),
+                [
+                    dict(
+                        target_recording_id=int(target_recording_id),
+                        embedding_model=embedding_model,
+                        embedding=np.asarray(embedding, dtype=np.float32).tobytes(),
                     )
-                )
+                    for target_recording_id, embedding in zip(
+                        target_recording_ids, embeddings
+                    )
+                ],
+            )
+            session.commit()
 
-            return target_recordings
+    def count_target_recordings(self, include_finished: bool) -> int:
+        with self._session() as session:
+            stmt = select(func.count()).select_from(tables.TargetRecording)
 
-    def count_target_recordings(self, include_finished: bool):
-        with Session(self.engine) as session:
-            stmt = select(tables.TargetRecording)
+            if not include_finished:
+                stmt = stmt.where(tables.TargetRecording.finished.is_(False))
+
+            return session.execute(stmt).scalar_one()
+
+    def count_target_recordings_by_finished(self) -> dict[bool, int]:
+        """Returns the number of finished and unfinished target recordings."""
+        with self._session() as session:
+            stmt = select(tables.TargetRecording.finished, func.count()).group_by(
+                tables.TargetRecording.finished
+            )
+
+            counts = {False: 0, True: 0}
+            for finished, count in session.execute(stmt).all():
+                counts[bool(finished)] = count
+            return counts
+
+    def count_target_recordings_by_label(
+        self, include_finished: bool
+    ) -> dict[str, int]:
+        with self._session() as session:
+            stmt = select(tables.TargetRecording.label, func.count()).group_by(
+                tables.TargetRecording.label
+            )
 
             if not include_finished:
                 stmt = stmt.where(tables.TargetRecording.finished.is_(False))
 
-            count = session.execute(stmt).scalars().all()
-            return len(count)
+            return {label: count for label, count in session.execute(stmt).all()}
 
     def set_finish_target_recording(self, target_recording_id: int, finished: bool):
-        with Session(self.engine) as session:
+        with self._session() as session:
             stmt = select(tables.TargetRecording).where(
                 tables.TargetRecording.id == target_recording_id
             )
@@ -372,7 +807,7 @@ class AnalyzerDB:
     def insert_classifier_output_window(
         self, classifier_output_id: int, window_id: int, logit: float, label: str
     ):
-        with Session(self.engine) as session:
+        with self._session() as session:
             db_classifier_output_window = tables.ClassifierOutputWindow(
                 classifier_output_id=classifier_output_id,
                 window_id=window_id,
@@ -387,7 +822,7 @@ class AnalyzerDB:
             return db_classifier_output_window.id
 
     def get_classifier_output_window(self, classifier_output_window_id: int):
-        with Session(self.engine) as session:
+        with self._session() as session:
             stmt = select(tables.ClassifierOutputWindow).where(
                 tables.ClassifierOutputWindow.id == classifier_output_window_id
             )
@@ -408,7 +843,7 @@ class AnalyzerDB:
         window_id: int | None = None,
         label: str | None = None,
     ):
-        with Session(self.engine) as session:
+        with self._session() as session:
             stmt = select(tables.ClassifierOutputWindow).where(
                 tables.ClassifierOutputWindow.classifier_output_id
                 == classifier_output_id
@@ -435,3 +870,403 @@ class AnalyzerDB:
                 )
 
             return classifier_output_windows
+
+    def get_classifier_output_labels(self, classifier_output_id: int) -> list[str]:
+        """Returns the distinct labels gathered for a classifier output."""
+        with self._session() as session:
+            stmt = (
+                select(tables.ClassifierOutputWindow.label)
+                .where(
+                    tables.ClassifierOutputWindow.classifier_output_id
+                    == classifier_output_id
+                )
+                .distinct()
+                .order_by(tables.ClassifierOutputWindow.label)
+            )
+
+            return list(session.execute(stmt).scalars().all())
+
+    def get_classifier_output_windows_frame(
+        self,
+        classifier_output_id: int,
+        window_id: int | None = None,
+        label: str | None = None,
+    ) -> pl.DataFrame:
+        """Classifier output windows as a polars frame, ordered by label then window id.
+
+        Columns are those of ClassifierOutputWindow; use this rather than
+        `get_all_classifier_output_windows` for anything beyond a handful of rows.
+        """
+        with self._session() as session:
+            stmt = (
+                select(
+                    tables.ClassifierOutputWindow.id,
+                    tables.ClassifierOutputWindow.classifier_output_id,
+                    tables.ClassifierOutputWindow.window_id,
+                    tables.ClassifierOutputWindow.label,
+                    tables.ClassifierOutputWindow.logit,
+                )
+                .where(
+                    tables.ClassifierOutputWindow.classifier_output_id
+                    == classifier_output_id
+                )
+                .order_by(
+                    tables.ClassifierOutputWindow.label,
+                    tables.ClassifierOutputWindow.window_id,
+                )
+            )
+
+            if window_id is not None:
+                stmt = stmt.where(tables.ClassifierOutputWindow.window_id == window_id)
+            if label is not None:
+                stmt = stmt.where(tables.ClassifierOutputWindow.label == label)
+
+            return pl.DataFrame(
+                session.execute(stmt).tuples().all(),
+                schema=CLASSIFIER_OUTPUT_WINDOWS_SCHEMA,
+                orient="row",
+            )
+
+    def insert_classifier_output_windows(
+        self,
+        classifier_output_id: int,
+        window_ids: Sequence[int] | np.ndarray,
+        logits: Sequence[float] | np.ndarray,
+        labels: Sequence[str] | np.ndarray,
+    ):
+        """Inserts many classifier output windows in a single transaction."""
+        if not len(window_ids) == len(logits) == len(labels):
+            raise ValueError("window_ids, logits and labels must have the same length")
+        if len(window_ids) == 0:
+            return
+
+        with self._session() as session:
+            session.execute(
+                insert(tables.ClassifierOutputWindow),
+                [
+                    dict(
+                        classifier_output_id=classifier_output_id,
+                        window_id=int(window_id),
+                        logit=float(logit),
+                        label=str(label),
+                    )
+                    for window_id, logit, label in zip(window_ids, logits, labels)
+                ],
+            )
+            session.commit()
+
+    def set_finish_target_recordings(
+        self, target_recording_ids: Sequence[int] | np.ndarray, finished: bool
+    ):
+        """Sets `finished` on many target recordings in a single UPDATE."""
+        with self._session() as session:
+            session.execute(
+                update(tables.TargetRecording)
+                .where(
+                    tables.TargetRecording.id.in_(
+                        [int(x) for x in target_recording_ids]
+                    )
+                )
+                .values(finished=finished)
+            )
+            session.commit()
+
+    def get_all_target_recording_ids(
+        self, include_finished: bool, label: str | None = None
+    ) -> np.ndarray:
+        """Returns target recording ids without loading their audio."""
+        with self._session() as session:
+            stmt = select(tables.TargetRecording.id).order_by(tables.TargetRecording.id)
+
+            if not include_finished:
+                stmt = stmt.where(tables.TargetRecording.finished.is_(False))
+            if label is not None:
+                stmt = stmt.where(tables.TargetRecording.label == label)
+
+            return np.array(session.execute(stmt).scalars().all(), dtype=np.int64)
+
+    def count_classifier_output_windows_by_label(
+        self, classifier_output_id: int
+    ) -> dict[str, int]:
+        """Returns how many windows were gathered per label for a classifier output."""
+        with self._session() as session:
+            stmt = (
+                select(tables.ClassifierOutputWindow.label, func.count())
+                .where(
+                    tables.ClassifierOutputWindow.classifier_output_id
+                    == classifier_output_id
+                )
+                .group_by(tables.ClassifierOutputWindow.label)
+            )
+
+            return {label: count for label, count in session.execute(stmt).all()}
+
+    def get_search_depths(self, target_recording_ids: Sequence[int]) -> dict[int, int]:
+        """Returns how many search results were stored for each target recording."""
+        with self._session() as session:
+            stmt = (
+                select(tables.SearchResult.target_recording_id, func.count())
+                .where(
+                    tables.SearchResult.target_recording_id.in_(
+                        [int(x) for x in target_recording_ids]
+                    )
+                )
+                .group_by(tables.SearchResult.target_recording_id)
+            )
+
+            depths = {int(x): 0 for x in target_recording_ids}
+            depths.update(dict(session.execute(stmt).tuples().all()))
+            return depths
+
+    def insert_search_results(
+        self,
+        target_recording_ids: Sequence[int] | np.ndarray,
+        window_ids: Sequence[int] | np.ndarray,
+        labels: Sequence[str],
+        distances: Sequence[float] | np.ndarray,
+        ranks: Sequence[int] | np.ndarray,
+    ):
+        """Inserts many search results in a single transaction, skipping known ones."""
+        if not (
+            len(target_recording_ids)
+            == len(window_ids)
+            == len(labels)
+            == len(distances)
+            == len(ranks)
+        ):
+            raise ValueError("all search result columns must have the same length")
+        if len(window_ids) == 0:
+            return
+
+        with self._session() as session:
+            session.execute(
+                sqlite_insert(tables.SearchResult).on_conflict_do_nothing(),
+                [
+                    dict(
+                        target_recording_id=int(target_recording_id),
+                        window_id=int(window_id),
+                        label=str(label),
+                        distance=float(distance),
+                        rank=int(rank),
+                    )
+                    for target_recording_id, window_id, label, distance, rank in zip(
+                        target_recording_ids, window_ids, labels, distances, ranks
+                    )
+                ],
+            )
+            session.commit()
+
+    def get_best_search_distances(
+        self, window_ids: Sequence[int]
+    ) -> dict[tuple[int, str], float]:
+        """Returns the best search distance of each (window_id, label) of these windows."""
+        unique_window_ids = sorted({int(x) for x in window_ids})
+        distances: dict[tuple[int, str], float] = {}
+
+        with self._session() as session:
+            for start in range(0, len(unique_window_ids), QUERY_CHUNK_SIZE):
+                stmt = (
+                    select(
+                        tables.SearchResult.window_id,
+                        tables.SearchResult.label,
+                        func.min(tables.SearchResult.distance),
+                    )
+                    .where(
+                        tables.SearchResult.window_id.in_(
+                            unique_window_ids[start : start + QUERY_CHUNK_SIZE]
+                        )
+                    )
+                    .group_by(tables.SearchResult.window_id, tables.SearchResult.label)
+                )
+                for window_id, label, distance in session.execute(stmt).tuples():
+                    distances[(window_id, label)] = distance
+
+        return distances
+
+    def get_review_queue_sync_annotation_id(self) -> int:
+        """The newest hoplite annotation id the review queue has been synced to.
+
+        Queues synced before this was recorded start from their newest item.
+        """
+        with self._session() as session:
+            last_annotation_id = session.execute(
+                select(tables.ReviewQueueSync.last_annotation_id).where(
+                    tables.ReviewQueueSync.id == REVIEW_QUEUE_SYNC_ID
+                )
+            ).scalar_one_or_none()
+            if last_annotation_id is not None:
+                return last_annotation_id
+
+            stmt = select(func.max(tables.ReviewQueueItem.annotation_id))
+            return session.execute(stmt).scalar_one() or 0
+
+    def set_review_queue_sync_annotation_id(self, annotation_id: int):
+        """Records that the review queue has read hoplite up to `annotation_id`.
+
+        Never moves backwards, so a slower concurrent sync cannot undo a newer one.
+        """
+        sync = tables.ReviewQueueSync
+        with self._session() as session:
+            session.execute(
+                sqlite_insert(sync)
+                .values(id=REVIEW_QUEUE_SYNC_ID, last_annotation_id=int(annotation_id))
+                .on_conflict_do_update(
+                    index_elements=[sync.id],
+                    set_=dict(
+                        last_annotation_id=func.max(
+                            sync.last_annotation_id, int(annotation_id)
+                        )
+                    ),
+                )
+            )
+            session.commit()
+
+    def insert_review_queue_items(
+        self,
+        annotation_ids: Sequence[int],
+        window_ids: Sequence[int],
+        recording_ids: Sequence[int],
+        labels: Sequence[str],
+        priorities: Sequence[float],
+    ):
+        """Adds annotations to the review queue, skipping ones already in it."""
+        if not (
+            len(annotation_ids)
+            == len(window_ids)
+            == len(recording_ids)
+            == len(labels)
+            == len(priorities)
+        ):
+            raise ValueError("all review queue columns must have the same length")
+        if len(annotation_ids) == 0:
+            return
+
+        with self._session() as session:
+            session.execute(
+                sqlite_insert(tables.ReviewQueueItem).on_conflict_do_nothing(),
+                [
+                    dict(
+                        annotation_id=int(annotation_id),
+                        window_id=int(window_id),
+                        recording_id=int(recording_id),
+                        label=str(label),
+                        priority=float(priority),
+                    )
+                    for annotation_id, window_id, recording_id, label, priority in zip(
+                        annotation_ids, window_ids, recording_ids, labels, priorities
+                    )
+                ],
+            )
+            session.commit()
+
+    def claim_review_queue_items(
+        self,
+        claimed_by: str,
+        num_items: int = 1,
+        order: ReviewQueueOrder = "score",
+        label: str | None = None,
+    ) -> list[ReviewQueueItem]:
+        """Claims up to `num_items` open review queue items for `claimed_by`, in order.
+
+        Items `claimed_by` already holds count towards `num_items` and have their
+        claim renewed, unless they do not match `label`, in which case they are
+        released back to the queue. The rest are the first unclaimed (or expired)
+        items in `order`, claimed in a single UPDATE so two reviewers never get the
+        same item.
+        """
+        now = dt.now()
+        expired = (now - timedelta(seconds=REVIEW_CLAIM_TIMEOUT_S)).isoformat()
+        item = tables.ReviewQueueItem
+        claimable = or_(item.claimed_by.is_(None), item.claimed_at < expired)
+        order_by = {
+            "score": (item.priority, item.id),
+            "label": (item.label, item.priority, item.id),
+            "recording": (item.recording_id, item.id),
+        }[order]
+
+        held_filter = [item.claimed_by == claimed_by, item.done.is_(False)]
+        with self._session() as session:
+            if label is not None:
+                session.execute(
+                    update(item)
+                    .where(*held_filter, item.label != label)
+                    .values(claimed_by=None, claimed_at=None)
+                    .execution_options(synchronize_session=False)
+                )
+                held_filter.append(item.label == label)
+
+            held = list(
+                session.execute(
+                    update(item)
+                    .where(*held_filter)
+                    .values(claimed_at=now.isoformat())
+                    .returning(item)
+                    .execution_options(synchronize_session=False)
+                ).scalars()
+            )
+
+            if len(held) < num_items:
+                next_ids = (
+                    select(item.id)
+                    .where(item.done.is_(False), claimable)
+                    .order_by(*order_by)
+                    .limit(num_items - len(held))
+                )
+                if label is not None:
+                    next_ids = next_ids.where(item.label == label)
+
+                held += session.execute(
+                    update(item)
+                    .where(item.id.in_(next_ids), claimable)
+                    .values(claimed_by=claimed_by, claimed_at=now.isoformat())
+                    .returning(item)
+                    .execution_options(synchronize_session=False)
+                ).scalars()
+
+            review_queue_items = [
+                ReviewQueueItem(
+                    id=db_item.id,
+                    annotation_id=db_item.annotation_id,
+                    window_id=db_item.window_id,
+                    recording_id=db_item.recording_id,
+                    label=db_item.label,
+                    priority=db_item.priority,
+                    claimed_by=db_item.claimed_by,
+                )
+                for db_item in held
+            ]
+            session.commit()
+
+        sort_key = {
+            "score": lambda i: (i.priority, i.id),
+            "label": lambda i: (i.label, i.priority, i.id),
+            "recording": lambda i: (i.recording_id, i.id),
+        }[order]
+        return sorted(review_queue_items, key=sort_key)
+
+    def finish_review_queue_item(self, review_queue_item_id: int):
+        with self._session() as session:
+            session.execute(
+                update(tables.ReviewQueueItem)
+                .where(tables.ReviewQueueItem.id == review_queue_item_id)
+                .values(done=True)
+            )
+            session.commit()
+
+    def get_review_queue_window_ids(self, done: bool = False) -> list[int]:
+        with self._session() as session:
+            stmt = (
+                select(tables.ReviewQueueItem.window_id)
+                .where(tables.ReviewQueueItem.done.is_(done))
+                .distinct()
+            )
+            return list(session.execute(stmt).scalars().all())
+
+    def count_review_queue_items(self, done: bool = False) -> int:
+        with self._session() as session:
+            stmt = (
+                select(func.count())
+                .select_from(tables.ReviewQueueItem)
+                .where(tables.ReviewQueueItem.done.is_(done))
+            )
+            return session.execute(stmt).scalar_one()
@@ -0,0 +1,57 @@
+from sqlalchemy import Connection, Engine, create_engine, event
+
+# how long a connection waits on another writer before raising "database is locked"
+BUSY_TIMEOUT_S = 30
+
+# connections kept open for the GUI worker threads, plus temporary extras
+POOL_SIZE = 8
+MAX_OVERFLOW = 8
+
+PRAGMAS = {
+    # readers never block the writer and the writer never blocks readers
+    "journal_mode": "WAL",
+    # with WAL, NORMAL only risks the last commits on power loss, never corruption
+    "synchronous": "NORMAL",
+    # negative means KiB, so 64 MiB of page cache per connection
+    "cache_size": -64_000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT_S * 1000,
+}
+
+# set in `Connection.info` to take the write lock when the transaction begins
+BEGIN_IMMEDIATE = "begin_immediate"
+
+
+def create_sqlite_engine(db_path: str) -> Engine:
+    """Creates a pooled engine for a sqlite database shared by threads and processes.
+
+    Every pooled connection gets PRAGMAS applied. Transactions are begun by us
+    rather than by pysqlite, so SAVEPOINTs work (see `AnalyzerDB.batch`) and a
+    transaction can take the write lock up front with BEGIN IMMEDIATE.
+    """
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_S},
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        # stop pysqlite from emitting its own BEGIN, see the "begin" listener
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin(connection: Connection):
+        if connection.info.pop(BEGIN_IMMEDIATE, False):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            connection.exec_driver_sql("BEGIN")
+
+    return engine
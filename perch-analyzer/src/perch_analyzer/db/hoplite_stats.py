@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from perch_hoplite.db import interface
+from perch_hoplite.db.sqlite_usearch_impl import SQLiteUSearchDB
+
+
+@dataclass
+class WindowsPerRecording:
+    """Distribution of the number of windows per recording."""
+
+    num_recordings: int
+    min_windows: int
+    max_windows: int
+    mean_windows: float
+
+
+def count_recordings(hoplite_db: SQLiteUSearchDB) -> int:
+    cursor = hoplite_db._get_cursor()
+    cursor.execute("SELECT COUNT(*) FROM recordings")
+    return cursor.fetchone()[0]
+
+
+def count_annotations(
+    hoplite_db: SQLiteUSearchDB, label_type: interface.LabelType | None = None
+) -> int:
+    cursor = hoplite_db._get_cursor()
+    if label_type is None:
+        cursor.execute("SELECT COUNT(*) FROM annotations")
+    else:
+        cursor.execute(
+            "SELECT COUNT(*) FROM annotations WHERE label_type = ?",
+            (label_type.value,),
+        )
+    return cursor.fetchone()[0]
+
+
+def count_annotations_by_label(
+    hoplite_db: SQLiteUSearchDB, label_type: interface.LabelType | None = None
+) -> dict[str, int]:
+    cursor = hoplite_db._get_cursor()
+    if label_type is None:
+        cursor.execute("SELECT label, COUNT(*) FROM annotations GROUP BY label")
+    else:
+        cursor.execute(
+            """
+            SELECT label, COUNT(*) FROM annotations
+            WHERE label_type = ?
+            GROUP BY label
+            """,
+            (label_type.value,),
+        )
+    return {label: count for label, count in cursor.fetchall()}
+
+
+def count_annotations_by_label_type(
+    hoplite_db: SQLiteUSearchDB,
+) -> dict[interface.LabelType, int]:
+    cursor = hoplite_db._get_cursor()
+    cursor.execute("SELECT label_type, COUNT(*) FROM annotations GROUP BY label_type")
+    return {
+        interface.LabelType(label_type): count
+        for label_type, count in cursor.fetchall()
+    }
+
+
+def count_annotations_by_provenance(hoplite_db: SQLiteUSearchDB) -> dict[str, int]:
+    cursor = hoplite_db._get_cursor()
+    cursor.execute("SELECT provenance, COUNT(*) FROM annotations GROUP BY provenance")
+    return {provenance: count for provenance, count in cursor.fetchall()}
+
+
+def windows_per_recording(hoplite_db: SQLiteUSearchDB) -> WindowsPerRecording:
+    """Summarizes how many windows each recording has, including empty recordings."""
+    cursor = hoplite_db._get_cursor()
+    cursor.execute(
+        """
+        SELECT COUNT(*), MIN(num_windows), MAX(num_windows), AVG(num_windows)
+        FROM (
+            SELECT COUNT(windows.id) AS num_windows
+            FROM recordings LEFT JOIN windows ON windows.recording_id = recordings.id
+            GROUP BY recordings.id
+        )
+        """
+    )
+    num_recordings, min_windows, max_windows, mean_windows = cursor.fetchone()
+    return WindowsPerRecording(
+        num_recordings=num_recordings,
+        min_windows=min_windows or 0,
+        max_windows=max_windows or 0,
+        mean_windows=mean_windows or 0.0,
+    )
@@ -0,0 +1,76 @@
+from sqlalchemy import Engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+import logging
+import perch_analyzer.db.tables as tables
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(engine: Engine):
+    """Adds columns declared in `tables` that are missing from an existing database.
+
+    `create_all` only creates missing tables, so columns added to an existing table
+    need an ALTER TABLE. New columns must be nullable or have a server default.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in tables.Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+
+                if column.server_default is not None:
+                    default = column.server_default.arg  # type: ignore
+                    if isinstance(default, str):
+                        default = f"'{default}'"
+                    else:
+                        default = default.compile(
+                            dialect=engine.dialect,
+                            compile_kwargs={"literal_binds": True},
+                        )
+                    ddl += f" DEFAULT {default}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                elif not column.nullable:
+                    raise ValueError(
+                        f"cannot add non-nullable column {table.name}.{column.name} without a server default"
+                    )
+
+                connection.execute(text(ddl))
+
+
+def add_missing_indexes(engine: Engine):
+    """Creates indexes declared in `tables` that are missing from an existing database.
+
+    Like columns, `create_all` skips indexes of tables that already exist. A unique
+    index that existing rows violate is skipped with a warning and retried on the
+    next open.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in tables.Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                try:
+                    with connection.begin_nested():
+                        index.create(connection)
+                except IntegrityError:
+                    logger.warning(
+                        f"not creating unique index {index.name}, existing rows of {table.name} violate it"
+                    )
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, JSON
+from sqlalchemy import ForeignKey, Index, JSON, LargeBinary, false, true
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -21,6 +21,15 @@ class Classifier(Base):
     learning_rate: Mapped[float] = mapped_column()
     weak_neg_rate: Mapped[float] = mapped_column()
     num_train_steps: Mapped[int] = mapped_column()
+    # headline metrics, copied from the metrics file so listings need not load it
+    roc_auc: Mapped[float | None] = mapped_column(nullable=True, index=True)
+    cmap: Mapped[float | None] = mapped_column(nullable=True, index=True)
+    top1_acc: Mapped[float | None] = mapped_column(nullable=True, index=True)
+    # false for classifiers inserted before headline metrics were stored, until
+    # they are copied from the metrics file; a missing metric then stays None
+    headline_metrics_stored: Mapped[bool] = mapped_column(
+        default=True, server_default=false()
+    )
 
 
 class ClassifierOutput(Base):
@@ -28,10 +37,48 @@ class ClassifierOutput(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     classifier_id: Mapped[int] = mapped_column(ForeignKey("classifiers.id"))
+    # outputs written before parts were tracked were always complete
+    finished: Mapped[bool] = mapped_column(default=False, server_default=true())
+
+
+class ClassifierOutputPart(Base):
+    __tablename__ = "classifier_output_parts"
+    __table_args__ = (
+        Index(
+            "ix_classifier_output_parts_output_start",
+            "classifier_output_id",
+            "start_window_id",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    classifier_output_id: Mapped[int] = mapped_column(
+        ForeignKey("classifier_outputs.id")
+    )
+    # inclusive range of window ids covered by this part
+    start_window_id: Mapped[int] = mapped_column()
+    end_window_id: Mapped[int] = mapped_column()
+    num_windows: Mapped[int] = mapped_column()
+    filename: Mapped[str] = mapped_column()
 
 
 class ClassifierOutputWindow(Base):
     __tablename__ = "classifier_output_windows"
+    # covers the page filters (output, output + label) and the window id lookups
+    # used to skip already gathered windows, without touching the table itself
+    __table_args__ = (
+        Index(
+            "ix_classifier_output_windows_output_label_window",
+            "classifier_output_id",
+            "label",
+            "window_id",
+        ),
+        Index(
+            "ix_classifier_output_windows_output_window",
+            "classifier_output_id",
+            "window_id",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     classifier_output_id: Mapped[int] = mapped_column(
@@ -44,9 +91,100 @@ class ClassifierOutputWindow(Base):
 
 class TargetRecording(Base):
     __tablename__ = "target_recordings"
+    # NULLs never collide, so recordings added from files (no xc_id) and those from
+    # before audio was hashed are unaffected
+    __table_args__ = (
+        Index("ux_target_recordings_xc_id_label", "xc_id", "label", unique=True),
+        # the same clip may be a target recording of several labels
+        Index(
+            "ux_target_recordings_audio_hash_label", "audio_hash", "label", unique=True
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    xc_id: Mapped[int | None] = mapped_column(nullable=True, unique=False)
+    xc_id: Mapped[int | None] = mapped_column(nullable=True, unique=False, index=True)
     filename: Mapped[str | None] = mapped_column(nullable=True, unique=False)
     label: Mapped[str] = mapped_column()
-    finished: Mapped[bool] = mapped_column(default=False)
+    finished: Mapped[bool] = mapped_column(default=False, index=True)
+    # sha256 of the float32 audio, which is stored as {audio_hash}.wav
+    audio_hash: Mapped[str | None] = mapped_column(nullable=True)
+
+
+class TargetRecordingEmbedding(Base):
+    __tablename__ = "target_recording_embeddings"
+    __table_args__ = (
+        Index(
+            "ux_target_recording_embeddings_recording_model",
+            "target_recording_id",
+            "embedding_model",
+            unique=True,
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    target_recording_id: Mapped[int] = mapped_column(ForeignKey("target_recordings.id"))
+    embedding_model: Mapped[str] = mapped_column()
+    # raw float32 bytes
+    embedding: Mapped[bytes] = mapped_column(LargeBinary)
+
+
+class SearchResult(Base):
+    __tablename__ = "search_results"
+    __table_args__ = (
+        Index(
+            "ux_search_results_target_recording_window",
+            "target_recording_id",
+            "window_id",
+            unique=True,
+        ),
+        Index("ix_search_results_label_distance", "label", "distance"),
+        Index("ix_search_results_window_label", "window_id", "label"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    target_recording_id: Mapped[int] = mapped_column(ForeignKey("target_recordings.id"))
+    window_id: Mapped[int] = mapped_column()
+    label: Mapped[str] = mapped_column()
+    # as returned by the hoplite usearch index, smaller is more similar
+    distance: Mapped[float] = mapped_column()
+    # position in the target recording's search results, starting at 0
+    rank: Mapped[int] = mapped_column()
+
+
+class ReviewQueueItem(Base):
+    __tablename__ = "review_queue_items"
+    # one index per queue order, each leading with `done` so the next open item is
+    # found without scanning reviewed ones
+    __table_args__ = (
+        Index("ix_review_queue_items_done_priority", "done", "priority", "id"),
+        Index(
+            "ix_review_queue_items_done_label_priority",
+            "done",
+            "label",
+            "priority",
+            "id",
+        ),
+        Index("ix_review_queue_items_done_recording", "done", "recording_id", "id"),
+        Index("ix_review_queue_items_claimed_by", "claimed_by", "done"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # the hoplite UNCERTAIN annotation to review
+    annotation_id: Mapped[int] = mapped_column(unique=True)
+    window_id: Mapped[int] = mapped_column()
+    recording_id: Mapped[int] = mapped_column()
+    label: Mapped[str] = mapped_column()
+    # best search distance of the window for the label, smaller is reviewed first
+    priority: Mapped[float] = mapped_column()
+    claimed_by: Mapped[str | None] = mapped_column(nullable=True)
+    claimed_at: Mapped[str | None] = mapped_column(nullable=True)
+    done: Mapped[bool] = mapped_column(default=False)
+
+
+class ReviewQueueSync(Base):
+    __tablename__ = "review_queue_sync"
+    # a single row, how far syncs of the review queue have read hoplite annotations
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # newest hoplite annotation id a sync has read, of any label type
+    last_annotation_id: Mapped[int] = mapped_column()
@@ -1,85 +1,223 @@
 from perch_analyzer.config import config
 from perch_hoplite.db.sqlite_usearch_impl import SQLiteUSearchDB
 from perch_hoplite.db import interface
-from perch_hoplite import audio_io
 from perch_hoplite.agile import embedding_display
 from pathlib import Path
-from librosa import display as librosa_display
-import matplotlib.pyplot as plt
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable
+from perch_analyzer.examine import spectrogram, window_audio
 from scipy.io import wavfile
-import numpy as np
+import functools
 import logging
+import numpy as np
+import os
+import threading
+
+if TYPE_CHECKING:
+    from perch_analyzer.examine import prefetch
 
 logger = logging.getLogger(__name__)
 
+# melspec frames per second, see embedding_display.get_melspec_layer
+MELSPEC_FRAME_RATE_HZ = 100
+# pixels per melspec frame and mel bin in the rendered spectrograms
+SPECTROGRAM_SCALE = 2
+# windows whose audio is loaded together, bounds the decoded audio held at once
+RENDER_BATCH_SIZE = 32
+
+
+@dataclass
+class WindowRenderJob:
+    """Everything needed to render a window's wav and png, without the hoplite db."""
+
+    recording: interface.Recording
+    window: interface.Window
+    sample_rate: int
+    window_size_s: float
+    base_path: str
+    recording_file: Path
+    spec_file: Path
 
-def get_audio_window_path(
-    config: config.Config, hoplite_db: SQLiteUSearchDB, window_id: int
-) -> tuple[Path, Path]:
-    recording_file = (
-        Path(config.data_path) / config.precomputed_windows_dir / f"{window_id}.wav"
-    )
-    spec_file = (
-        Path(config.data_path) / config.precomputed_windows_dir / f"{window_id}.png"
-    )
 
+def get_window_files(config: config.Config, window_id: int) -> tuple[Path, Path]:
+    window_dir = Path(config.data_path) / config.precomputed_windows_dir
+    return window_dir / f"{window_id}.wav", window_dir / f"{window_id}.png"
+
+
+def get_render_settings(hoplite_db: SQLiteUSearchDB) -> tuple[int, float, str]:
+    """Returns the (sample_rate, window_size_s, base_path) windows are rendered with."""
     # TODO: make this less cursed/more robust
     model_config = hoplite_db.get_metadata("model_config").model_config
     sample_rate = model_config.sample_rate  # type: ignore
     window_size_s = model_config.window_size_s  # type: ignore
     audio_globs = hoplite_db.get_metadata("audio_sources").audio_globs
     base_path = audio_globs[0]["base_path"]  # type: ignore
+    return int(sample_rate), float(window_size_s), base_path
+
+
+def get_render_job(
+    config: config.Config, hoplite_db: SQLiteUSearchDB, window_id: int
+) -> WindowRenderJob | None:
+    """Returns the job that renders a window, or None if it is already rendered."""
+    jobs = get_render_jobs(config, hoplite_db, [window_id])
+    return jobs[0] if jobs else None
 
-    if not recording_file.exists() or not spec_file.exists():
+
+def get_render_jobs(
+    config: config.Config, hoplite_db: SQLiteUSearchDB, window_ids: Iterable[int]
+) -> list[WindowRenderJob]:
+    """Returns the jobs that render these windows, skipping already rendered ones."""
+    unrendered = []
+    for window_id in dict.fromkeys(int(window_id) for window_id in window_ids):
+        recording_file, spec_file = get_window_files(config, window_id)
+        if not (recording_file.exists() and spec_file.exists()):
+            unrendered.append((window_id, recording_file, spec_file))
+    if not unrendered:
+        return []
+
+    sample_rate, window_size_s, base_path = get_render_settings(hoplite_db)
+    recordings: dict[int, interface.Recording] = {}
+    jobs = []
+    for window_id, recording_file, spec_file in unrendered:
         window = hoplite_db.get_window(window_id)
-        recording = hoplite_db.get_recording(window.recording_id)
-        flush_window_to_disk(
-            recording=recording,
-            window=window,
-            sample_rate=int(sample_rate),
-            window_size_s=float(window_size_s),
-            base_path=base_path,
-            recording_file=recording_file,
-            spec_file=spec_file,
+        if window.recording_id not in recordings:
+            recordings[window.recording_id] = hoplite_db.get_recording(
+                window.recording_id
+            )
+        jobs.append(
+            WindowRenderJob(
+                recording=recordings[window.recording_id],
+                window=window,
+                sample_rate=sample_rate,
+                window_size_s=window_size_s,
+                base_path=base_path,
+                recording_file=recording_file,
+                spec_file=spec_file,
+            )
         )
+    return jobs
+
+
+def render(job: WindowRenderJob, loader: window_audio.WindowAudioLoader | None = None):
+    render_jobs([job], loader)
+
 
+def get_audio_window_path(
+    config: config.Config,
+    hoplite_db: SQLiteUSearchDB,
+    window_id: int,
+    prefetcher: "prefetch.WindowPrefetcher | None" = None,
+    loader: window_audio.WindowAudioLoader | None = None,
+) -> tuple[Path, Path]:
+    """Returns the window's wav and png, rendering them first if needed.
+
+    With a prefetcher, a render it already started is waited for instead of
+    being done twice.
+    """
+    job = get_render_job(config, hoplite_db, window_id)
+    if job is not None:
+        if prefetcher is not None:
+            prefetcher.prefetch(job).result()
+        else:
+            render(job, loader)
+
+    recording_file, spec_file = get_window_files(config, window_id)
     return recording_file.absolute(), spec_file.absolute()
 
 
-def flush_window_to_disk(
-    recording: interface.Recording,
-    window: interface.Window,
+def render_windows(
+    config: config.Config,
+    hoplite_db: SQLiteUSearchDB,
+    window_ids: Iterable[int],
+    loader: window_audio.WindowAudioLoader | None = None,
+) -> int:
+    """Renders the windows that are not rendered yet, returns how many were."""
+    jobs = get_render_jobs(config, hoplite_db, window_ids)
+    return render_jobs(jobs, loader)
+
+
+def render_jobs(
+    jobs: list[WindowRenderJob],
+    loader: window_audio.WindowAudioLoader | None = None,
+) -> int:
+    """Renders windows in (recording, offset) order, returns how many were.
+
+    Audio is loaded through `loader`, or a loader used only for these jobs, in
+    batches so windows of the same recording share decoded audio.
+    """
+    if loader is None:
+        with window_audio.WindowAudioLoader() as loader:
+            return render_jobs(jobs, loader)
+
+    jobs = sorted(
+        jobs, key=lambda job: (job.recording.filename, float(job.window.offsets[0]))
+    )
+    for start in range(0, len(jobs), RENDER_BATCH_SIZE):
+        batch = jobs[start : start + RENDER_BATCH_SIZE]
+        # a batch shares one sample rate and window size, they come from the
+        # hoplite db's model config
+        audio_slices = loader.load_windows(
+            [
+                (
+                    f"{job.base_path}/{job.recording.filename}",
+                    float(job.window.offsets[0]),
+                )
+                for job in batch
+            ],
+            window_size_s=batch[0].window_size_s,
+            sample_rate=batch[0].sample_rate,
+        )
+        for job, audio_slice in zip(batch, audio_slices):
+            logger.info(f"flushing window id: {job.window.id} to disk")
+            write_window(
+                audio_slice, job.sample_rate, job.recording_file, job.spec_file
+            )
+    return len(jobs)
+
+
+@functools.cache
+def _melspec_layer(sample_rate: int):
+    return embedding_display.get_melspec_layer(sample_rate)
+
+
+def _tmp_path(path: str | Path) -> Path:
+    """A temporary name for `path` no other thread or process writes to."""
+    return Path(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def write_window(
+    audio_slice: np.ndarray,
     sample_rate: int,
-    window_size_s: float,
-    base_path: str,
     recording_file: str | Path,
     spec_file: str | Path,
 ):
-    logger.info(f"flushing window id: {window.id} to disk")
-    audio_slice = audio_io.load_audio_window_soundfile(
-        f"{base_path}/{recording.filename}",
-        offset_s=window.offsets[0],
-        window_size_s=window_size_s,
-        sample_rate=sample_rate,
-    )
+    """Writes a window's audio as a wav and its melspectrogram as a png."""
+    # written under a temporary name and renamed, so a half-written file is never
+    # served or mistaken for a rendered window. The prefetcher, the pages and
+    # precompute workers may render the same window at once, so each writer has
+    # its own temporary files and the last rename wins.
+    tmp_recording_file = _tmp_path(recording_file)
+    tmp_spec_file = _tmp_path(spec_file)
+    try:
+        wavfile.write(tmp_recording_file, sample_rate, np.float32(audio_slice))
 
-    wavfile.write(recording_file, sample_rate, np.float32(audio_slice))
-
-    melspec_layer = embedding_display.get_melspec_layer(sample_rate)
-    if audio_slice.shape[0] < sample_rate / 100 + 1:
-        # Center pad if audio is too short.
-        zs = np.zeros([sample_rate // 10], dtype=audio_slice.dtype)
-        audio_slice = np.concatenate([zs, audio_slice, zs], axis=0)
-    melspec = melspec_layer(audio_slice).T  # type: ignore
-
-    librosa_display.specshow(
-        melspec,
-        sr=sample_rate,
-        y_axis="mel",
-        x_axis="time",
-        hop_length=sample_rate // 100,
-        cmap="Greys",
-    )
-    with Path(spec_file).open("wb") as f:
-        plt.savefig(f)
-    plt.close()
+        melspec_layer = _melspec_layer(sample_rate)
+        if audio_slice.shape[0] < sample_rate / 100 + 1:
+            # Center pad if audio is too short.
+            zs = np.zeros([sample_rate // 10], dtype=audio_slice.dtype)
+            audio_slice = np.concatenate([zs, audio_slice, zs], axis=0)
+        melspec = np.asarray(melspec_layer(audio_slice))  # [frames, mel_bins]
+
+        spectrogram.write_spectrogram(
+            melspec,
+            tmp_spec_file,
+            frame_rate_hz=MELSPEC_FRAME_RATE_HZ,
+            axes=True,
+            scale=SPECTROGRAM_SCALE,
+        )
+
+        tmp_recording_file.replace(recording_file)
+        tmp_spec_file.replace(spec_file)
+    finally:
+        tmp_recording_file.unlink(missing_ok=True)
+        tmp_spec_file.unlink(missing_ok=True)
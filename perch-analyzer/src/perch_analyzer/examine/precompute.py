@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime as dt
+from perch_analyzer.config import config
+from perch_analyzer.db import db
+from perch_analyzer.examine import audio_windows, review_queue
+from perch_hoplite.db import interface
+from perch_hoplite.db.sqlite_usearch_impl import SQLiteUSearchDB
+from typing import Iterable
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_WORKERS = 4
+
+
+@dataclass
+class PrecomputeStats:
+    num_windows: int
+    num_rendered: int
+    num_failed: int
+    elapsed_s: float
+
+    @property
+    def num_skipped(self) -> int:
+        """Windows that were already rendered."""
+        return self.num_windows - self.num_rendered - self.num_failed
+
+    @property
+    def windows_per_s(self) -> float:
+        return self.num_rendered / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+
+def pending_annotation_window_ids(
+    analyzer_db: db.AnalyzerDB, hoplite_db: SQLiteUSearchDB
+) -> list[int]:
+    """Windows of UNCERTAIN annotations that are waiting to be reviewed."""
+    review_queue.sync_review_queue(analyzer_db, hoplite_db)
+    return analyzer_db.get_review_queue_window_ids(done=False)
+
+
+def classifier_output_window_ids(
+    analyzer_db: db.AnalyzerDB, classifier_output_id: int, label: str | None = None
+) -> list[int]:
+    """Windows gathered from a classifier output, i.e. those shown on its page."""
+    windows = analyzer_db.get_classifier_output_windows_frame(
+        classifier_output_id, label=label
+    )
+    return windows["window_id"].unique().to_list()
+
+
+def labeled_window_ids(
+    hoplite_db: SQLiteUSearchDB,
+    label: str,
+    label_type: interface.LabelType = interface.LabelType.POSITIVE,
+) -> list[int]:
+    """Windows with an annotation of this label and label type."""
+    matches = db.match_annotation_windows(
+        hoplite_db,
+        "annotations.label = ? AND annotations.label_type = ?",
+        (label, label_type.value),
+    )
+    return list(dict.fromkeys(window_id for _, window_id, _, _ in matches))
+
+
+def group_by_recording(
+    jobs: list[audio_windows.WindowRenderJob],
+) -> list[list[audio_windows.WindowRenderJob]]:
+    """Groups render jobs by source file, largest group first."""
+    groups: dict[int, list[audio_windows.WindowRenderJob]] = {}
+    for job in jobs:
+        groups.setdefault(job.recording.id, []).append(job)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def precompute_windows(
+    config: config.Config,
+    hoplite_db: SQLiteUSearchDB,
+    window_ids: Iterable[int],
+    workers: int = PRECOMPUTE_WORKERS,
+) -> PrecomputeStats:
+    """Renders the wavs and pngs of windows that are not rendered yet.
+
+    Windows are grouped by source file and each group is rendered by one worker
+    process, which decodes the file once through a WindowAudioLoader and slices
+    every window from it.
+    """
+    window_ids = list(dict.fromkeys(int(window_id) for window_id in window_ids))
+    before = dt.now()
+
+    jobs = audio_windows.get_render_jobs(config, hoplite_db, window_ids)
+    groups = group_by_recording(jobs)
+    logger.info(
+        f"rendering {len(jobs)} of {len(window_ids)} windows "
+        f"from {len(groups)} recordings"
+    )
+
+    num_rendered = 0
+    num_failed = 0
+    if groups:
+        # spawn rather than fork, the parent may hold tensorflow/jax state
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                executor.submit(audio_windows.render_jobs, group): group
+                for group in groups
+            }
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    num_rendered += future.result()
+                except Exception as e:
+                    num_failed += len(group)
+                    logger.error(
+                        f"failed to render {len(group)} windows of "
+                        f"{group[0].recording.filename}: {e}"
+                    )
+
+    stats = PrecomputeStats(
+        num_windows=len(window_ids),
+        num_rendered=num_rendered,
+        num_failed=num_failed,
+        elapsed_s=(dt.now() - before).total_seconds(),
+    )
+    logger.info(
+        f"rendered {stats.num_rendered} windows in {stats.elapsed_s:.1f}s "
+        f"({stats.windows_per_s:.1f} windows/s), skipped {stats.num_skipped}, "
+        f"failed {stats.num_failed}"
+    )
+    return stats
@@ -0,0 +1,55 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from perch_analyzer.examine import audio_windows, window_audio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_WORKERS = 4
+
+
+class WindowPrefetcher:
+    """Renders window wavs and pngs on a background thread pool.
+
+    Each window is rendered at most once at a time: prefetching a window that is
+    already being rendered returns the render in flight. Audio is loaded through
+    `loader`, so prefetched windows share open files and decoded audio with it.
+    """
+
+    def __init__(
+        self,
+        workers: int = PREFETCH_WORKERS,
+        loader: window_audio.WindowAudioLoader | None = None,
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="window-prefetch"
+        )
+        self._loader = loader or window_audio.WindowAudioLoader()
+        self._lock = threading.Lock()
+        self._in_flight: dict[Path, Future] = {}
+
+    def prefetch(self, job: audio_windows.WindowRenderJob) -> Future:
+        with self._lock:
+            future = self._in_flight.get(job.spec_file)
+            if future is not None:
+                return future
+
+            future = self._executor.submit(audio_windows.render, job, self._loader)
+            self._in_flight[job.spec_file] = future
+
+        future.add_done_callback(lambda f: self._done(job, f))
+        return future
+
+    def _done(self, job: audio_windows.WindowRenderJob, future: Future):
+        with self._lock:
+            self._in_flight.pop(job.spec_file, None)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error(
+                f"failed to prefetch window id {job.window.id}: {future.exception()}"
+            )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,104 @@
+from perch_analyzer.db import db
+from perch_hoplite.db import interface
+from perch_hoplite.db.sqlite_usearch_impl import SQLiteUSearchDB
+
+# priority of windows that were not found by a search, reviewed after searched ones
+UNSCORED_PRIORITY = float("inf")
+
+
+def sync_review_queue(analyzer_db: db.AnalyzerDB, hoplite_db: SQLiteUSearchDB) -> int:
+    """Adds UNCERTAIN hoplite annotations added since the last sync to the queue.
+
+    Annotation ids only grow, so each sync records the newest annotation id it has
+    seen, of any label type, and the next one only reads annotations after it.
+    Returns the number of items added.
+    """
+    cursor = hoplite_db._get_cursor()
+    cursor.execute("SELECT MAX(id) FROM annotations")
+    (max_annotation_id,) = cursor.fetchone()
+    last_annotation_id = analyzer_db.get_review_queue_sync_annotation_id()
+    if max_annotation_id is None or max_annotation_id <= last_annotation_id:
+        return 0
+
+    matches = db.match_annotation_windows(
+        hoplite_db,
+        "annotations.id > ? AND annotations.id <= ? AND annotations.label_type = ?",
+        (
+            last_annotation_id,
+            max_annotation_id,
+            interface.LabelType.UNCERTAIN.value,
+        ),
+    )
+    annotation_ids = [annotation_id for annotation_id, _, _, _ in matches]
+    window_ids = [window_id for _, window_id, _, _ in matches]
+    recording_ids = [recording_id for _, _, recording_id, _ in matches]
+    labels = [label for _, _, _, label in matches]
+
+    if annotation_ids:
+        distances = analyzer_db.get_best_search_distances(window_ids)
+        analyzer_db.insert_review_queue_items(
+            annotation_ids=annotation_ids,
+            window_ids=window_ids,
+            recording_ids=recording_ids,
+            labels=labels,
+            priorities=[
+                distances.get((window_id, label), UNSCORED_PRIORITY)
+                for window_id, label in zip(window_ids, labels)
+            ],
+        )
+    analyzer_db.set_review_queue_sync_annotation_id(max_annotation_id)
+    return len(annotation_ids)
+
+
+def is_pending(hoplite_db: SQLiteUSearchDB, annotation_id: int) -> bool:
+    """Whether the annotation still exists and is still UNCERTAIN."""
+    cursor = hoplite_db._get_cursor()
+    cursor.execute(
+        "SELECT 1 FROM annotations WHERE id = ? AND label_type = ?",
+        (annotation_id, interface.LabelType.UNCERTAIN.value),
+    )
+    return cursor.fetchone() is not None
+
+
+def claim_next(
+    analyzer_db: db.AnalyzerDB,
+    hoplite_db: SQLiteUSearchDB,
+    claimed_by: str,
+    num_items: int = 1,
+    order: db.ReviewQueueOrder = "score",
+    label: str | None = None,
+) -> list[db.ReviewQueueItem]:
+    """Syncs the queue and claims the next items whose annotation is still pending.
+
+    The first item is the one to review now, the others can be prefetched. Items
+    whose annotation was removed or relabeled elsewhere (e.g. on the examine page)
+    are finished and skipped. Returns an empty list once the queue is empty.
+    """
+    sync_review_queue(analyzer_db, hoplite_db)
+
+    while True:
+        items = analyzer_db.claim_review_queue_items(
+            claimed_by, num_items, order, label
+        )
+        stale = [
+            item for item in items if not is_pending(hoplite_db, item.annotation_id)
+        ]
+        if not stale:
+            return items
+        for item in stale:
+            analyzer_db.finish_review_queue_item(item.id)
+
+
+def finish(
+    analyzer_db: db.AnalyzerDB,
+    hoplite_db: SQLiteUSearchDB,
+    review_queue_item_id: int,
+    annotation_id: int,
+):
+    """Removes the item's UNCERTAIN annotation and marks the item as reviewed.
+
+    The caller commits the hoplite db, usually after adding the reviewed labels.
+    """
+    if is_pending(hoplite_db, annotation_id):
+        hoplite_db.remove_annotation(annotation_id)
+    analyzer_db.finish_review_queue_item(review_queue_item_id)
@@ -0,0 +1,113 @@
+"""Renders melspectrograms straight to PNG, without matplotlib.
+
+Pixels are the melspec rescaled to [0, 255] per image and mapped through a
+colormap lookup table, then encoded with zlib. Rendering is pure NumPy, so it is
+thread-safe and many windows can be rendered at once.
+"""
+
+from pathlib import Path
+import numpy as np
+import struct
+import zlib
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# matplotlib's "Greys": low values white, high values black
+GREYS_LUT = np.arange(255, -1, -1, dtype=np.uint8)
+
+# tick marks drawn by the axis overlay
+TICK_LENGTH_PX = 6
+TICK_VALUE = 128
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+
+
+def encode_png(pixels: np.ndarray, compression_level: int = 6) -> bytes:
+    """Encodes a [height, width] uint8 grayscale image as a PNG."""
+    if pixels.ndim != 2 or pixels.dtype != np.uint8:
+        raise ValueError("pixels must be a 2D uint8 array")
+    height, width = pixels.shape
+
+    # every scanline starts with its filter type, 0 (none)
+    scanlines = np.zeros((height, width + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels
+
+    # 8-bit grayscale, default compression/filter, no interlacing
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return (
+        PNG_SIGNATURE
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression_level))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def to_pixels(
+    melspecs: np.ndarray,
+    lut: np.ndarray = GREYS_LUT,
+    scale: int = 1,
+) -> np.ndarray:
+    """Maps [batch, frames, mel_bins] melspecs to [batch, height, width] pixels.
+
+    Each image is rescaled between its own min and max, like specshow does, and
+    flipped so low frequencies are at the bottom. `scale` repeats every pixel to
+    enlarge the image.
+    """
+    melspecs = np.asarray(melspecs, dtype=np.float32)
+    lo = melspecs.min(axis=(1, 2), keepdims=True)
+    hi = melspecs.max(axis=(1, 2), keepdims=True)
+    normalized = (melspecs - lo) / np.maximum(hi - lo, 1e-12)
+
+    indices = np.clip(normalized * (len(lut) - 1) + 0.5, 0, len(lut) - 1)
+    pixels = lut[indices.astype(np.intp)]
+
+    # [batch, frames, mel_bins] -> [batch, mel_bins, frames], low frequencies last
+    pixels = pixels.transpose(0, 2, 1)[:, ::-1, :]
+    if scale > 1:
+        pixels = pixels.repeat(scale, axis=1).repeat(scale, axis=2)
+    return np.ascontiguousarray(pixels)
+
+
+def draw_time_ticks(pixels: np.ndarray, px_per_s: float, tick_interval_s: float = 1.0):
+    """Draws a tick mark every `tick_interval_s` along the bottom edge, in place."""
+    width = pixels.shape[-1]
+    tick_positions = np.arange(0, width, px_per_s * tick_interval_s).astype(int)
+    pixels[..., -TICK_LENGTH_PX:, tick_positions] = TICK_VALUE
+
+
+def render_spectrograms(
+    melspecs: np.ndarray,
+    frame_rate_hz: float,
+    axes: bool = False,
+    scale: int = 1,
+    lut: np.ndarray = GREYS_LUT,
+) -> list[bytes]:
+    """Renders a [batch, frames, mel_bins] batch of melspecs to PNG bytes.
+
+    With `axes`, a tick mark is drawn along the bottom edge every second.
+    """
+    pixels = to_pixels(melspecs, lut=lut, scale=scale)
+    if axes:
+        draw_time_ticks(pixels, px_per_s=frame_rate_hz * scale)
+    return [encode_png(image) for image in pixels]
+
+
+def write_spectrogram(
+    melspec: np.ndarray,
+    path: str | Path,
+    frame_rate_hz: float,
+    axes: bool = False,
+    scale: int = 1,
+):
+    """Renders a single [frames, mel_bins] melspec to a PNG file."""
+    (png,) = render_spectrograms(
+        melspec[None], frame_rate_hz=frame_rate_hz, axes=axes, scale=scale
+    )
+    Path(path).write_bytes(png)
@@ -0,0 +1,244 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from scipy import signal
+from typing import Sequence
+import math
+import numpy as np
+import soundfile
+import threading
+
+# source audio is decoded and cached in aligned chunks of this length
+CHUNK_S = 10.0
+# extra audio decoded on each side of a run of chunks, so the resampling filter
+# has context and chunk edges join without clicks
+CHUNK_PAD_S = 0.1
+MAX_OPEN_FILES = 16
+MAX_CACHED_CHUNKS = 32
+
+
+def resample(audio: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """Polyphase resampling, as audio_io does with librosa's "polyphase"."""
+    if from_rate == to_rate or not len(audio):
+        return audio
+    gcd = math.gcd(from_rate, to_rate)
+    return signal.resample_poly(audio, to_rate // gcd, from_rate // gcd).astype(
+        np.float32
+    )
+
+
+class WindowAudioLoader:
+    """Loads window audio from source files, reusing open files and decoded audio.
+
+    Source audio is decoded in fixed, aligned chunks of `chunk_s` seconds that are
+    resampled once and kept in an LRU cache, along with an LRU of open files.
+    Windows of the same long recording, which are usually next to each other, then
+    cost a slice instead of an open, seek, decode and resample each.
+
+    The loader is thread-safe, so one instance can be shared by every page. Its
+    lock only guards the caches: decoding happens outside it, so threads decode
+    different chunks in parallel, while a chunk already being decoded by one
+    thread is waited for rather than decoded again. Each open file has its own
+    lock, held only to seek and read.
+    """
+
+    def __init__(
+        self,
+        max_open_files: int = MAX_OPEN_FILES,
+        max_cached_chunks: int = MAX_CACHED_CHUNKS,
+        chunk_s: float = CHUNK_S,
+    ):
+        self.max_open_files = max_open_files
+        self.max_cached_chunks = max_cached_chunks
+        self.chunk_s = chunk_s
+        self._lock = threading.Lock()
+        # path -> open file and the lock held while seeking and reading it
+        self._files: OrderedDict[str, tuple[soundfile.SoundFile, threading.Lock]] = (
+            OrderedDict()
+        )
+        # (path, sample_rate, chunk index) -> resampled chunk
+        self._chunks: OrderedDict[tuple[str, int, int], np.ndarray] = OrderedDict()
+        # chunks being decoded by some thread
+        self._in_flight: dict[tuple[str, int, int], Future] = {}
+
+    def __enter__(self) -> "WindowAudioLoader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            files = list(self._files.values())
+            self._files.clear()
+            self._chunks.clear()
+        for f, file_lock in files:
+            with file_lock:
+                f.close()
+
+    def load_window(
+        self, path: str, offset_s: float, window_size_s: float, sample_rate: int
+    ) -> np.ndarray:
+        (audio,) = self.load_windows([(path, offset_s)], window_size_s, sample_rate)
+        return audio
+
+    def load_windows(
+        self,
+        requests: Sequence[tuple[str, float]],
+        window_size_s: float,
+        sample_rate: int,
+    ) -> list[np.ndarray]:
+        """Loads (path, offset_s) windows, returned in the order of `requests`.
+
+        Requests are served sorted by (path, offset), so each file is read once
+        and every contiguous stretch of missing chunks is decoded and resampled in
+        a single pass. Windows past the end of a file are cut short.
+        """
+        window_samples = int(window_size_s * sample_rate)
+        audio_slices: list[np.ndarray] = [np.zeros(0, dtype=np.float32)] * len(requests)
+
+        by_path: dict[str, list[int]] = {}
+        for i in sorted(range(len(requests)), key=lambda i: requests[i]):
+            by_path.setdefault(requests[i][0], []).append(i)
+
+        for path, indices in by_path.items():
+            spans = {
+                i: self._chunk_span(requests[i][1], window_size_s) for i in indices
+            }
+            chunk_indices = {
+                k for first, last in spans.values() for k in range(first, last + 1)
+            }
+            chunks = self._get_chunks(path, sample_rate, sorted(chunk_indices))
+
+            for i in indices:
+                first, last = spans[i]
+                audio = np.concatenate([chunks[k] for k in range(first, last + 1)])
+                start = int(
+                    round((requests[i][1] - first * self.chunk_s) * sample_rate)
+                )
+                audio_slices[i] = audio[start : start + window_samples]
+
+        return audio_slices
+
+    def _chunk_span(self, offset_s: float, window_size_s: float) -> tuple[int, int]:
+        """First and last chunk indices a window overlaps."""
+        first = max(int(offset_s // self.chunk_s), 0)
+        last = int(math.ceil((offset_s + window_size_s) / self.chunk_s)) - 1
+        return first, max(last, first)
+
+    def _file(self, path: str) -> tuple[soundfile.SoundFile, threading.Lock]:
+        """Returns the open file and its lock, opening it if needed."""
+        evicted = None
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is not None and not entry[0].closed:
+                self._files.move_to_end(path)
+                return entry
+
+            entry = (soundfile.SoundFile(path), threading.Lock())
+            self._files[path] = entry
+            if len(self._files) > self.max_open_files:
+                _, evicted = self._files.popitem(last=False)
+
+        if evicted is not None:
+            # waits for a read in progress, readers reopen a file closed under them
+            f, file_lock = evicted
+            with file_lock:
+                f.close()
+        return entry
+
+    def _get_chunks(
+        self, path: str, sample_rate: int, chunk_indices: list[int]
+    ) -> dict[int, np.ndarray]:
+        """Returns the chunks, decoding the uncached ones in contiguous runs.
+
+        Chunks another thread is decoding are waited for. The chunks are returned
+        directly rather than read back from the cache, so a request needing more
+        chunks than the cache holds still works.
+        """
+        chunks: dict[int, np.ndarray] = {}
+        waiting: dict[int, Future] = {}
+        owned: dict[int, Future] = {}
+        with self._lock:
+            for k in chunk_indices:
+                key = (path, sample_rate, k)
+                if key in self._chunks:
+                    self._chunks.move_to_end(key)
+                    chunks[k] = self._chunks[key]
+                elif key in self._in_flight:
+                    waiting[k] = self._in_flight[key]
+                else:
+                    owned[k] = self._in_flight[key] = Future()
+
+        missing = sorted(owned)
+        try:
+            run_start = 0
+            for j in range(1, len(missing) + 1):
+                if j == len(missing) or missing[j] != missing[j - 1] + 1:
+                    run = missing[run_start:j]
+                    decoded = self._decode_run(path, sample_rate, run[0], run[-1])
+                    chunks.update(decoded)
+                    with self._lock:
+                        for k, chunk in decoded.items():
+                            key = (path, sample_rate, k)
+                            self._chunks[key] = chunk
+                            del self._in_flight[key]
+                            if len(self._chunks) > self.max_cached_chunks:
+                                self._chunks.popitem(last=False)
+                    for k, chunk in decoded.items():
+                        owned[k].set_result(chunk)
+                    run_start = j
+        except BaseException as e:
+            with self._lock:
+                for k, future in owned.items():
+                    if not future.done():
+                        del self._in_flight[(path, sample_rate, k)]
+                        future.set_exception(e)
+            raise
+
+        for k, future in waiting.items():
+            chunks[k] = future.result()
+        return chunks
+
+    def _decode_run(
+        self, path: str, sample_rate: int, first: int, last: int
+    ) -> dict[int, np.ndarray]:
+        """Decodes chunks `first` to `last` of a file with a single resample."""
+        while True:
+            f, file_lock = self._file(path)
+            with file_lock:
+                if f.closed:
+                    # evicted by another thread before we got the lock
+                    continue
+                file_sample_rate = f.samplerate
+                frames = f.frames
+
+                start = min(int(round(first * self.chunk_s * file_sample_rate)), frames)
+                end = min(
+                    int(round((last + 1) * self.chunk_s * file_sample_rate)), frames
+                )
+                pad = int(CHUNK_PAD_S * file_sample_rate)
+                read_start = max(start - pad, 0)
+                read_end = min(end + pad, frames)
+
+                f.seek(read_start)
+                audio = f.read(read_end - read_start, dtype="float32")
+                break
+
+        # resampled outside the file lock
+        if audio.ndim == 2:
+            audio = audio[:, 0]
+        audio = resample(audio, file_sample_rate, sample_rate)
+
+        # drop the padding, in samples at the target rate
+        left = int(round((start - read_start) * sample_rate / file_sample_rate))
+        chunk_samples = int(round(self.chunk_s * sample_rate))
+        length = int(round((end - start) * sample_rate / file_sample_rate))
+        audio = audio[left : left + length]
+
+        # copies, so an evicted chunk does not keep the rest of its run alive
+        return {
+            k: audio[
+                (k - first) * chunk_samples : (k - first + 1) * chunk_samples
+            ].copy()
+            for k in range(first, last + 1)
+        }
@@ -3,14 +3,15 @@ from typing import Optional
 from pathlib import Path
 import os
 from perch_analyzer.gui.state import ConfigState
-from perch_analyzer.examine import examine_annotations, audio_windows
-from perch_hoplite.db import interface
-from ml_collections import config_dict
+from perch_analyzer.examine import examine_annotations, audio_windows, review_queue
 
 
 # Import WindowWithMetadata from examine_page to share the same dataclass
 from perch_analyzer.gui.examine_page import WindowWithMetadata
 
+# windows after the current one whose media is rendered ahead of time
+PREFETCH_COUNT = 5
+
 
 class AnnotateState(ConfigState):
     """State management for the annotate page."""
@@ -19,6 +20,9 @@ class AnnotateState(ConfigState):
     current_window: Optional[WindowWithMetadata] = None
     current_target_label: str = ""
     has_more_windows: bool = True
+    # the review queue item claimed for the current window, and its annotation
+    current_item_id: Optional[int] = None
+    current_annotation_id: Optional[int] = None
 
     # Label selection state
     all_labels: list[str] = []
@@ -36,37 +40,41 @@ class AnnotateState(ConfigState):
         """Load the next window to annotate."""
         hoplite_db = self.get_hoplite_db().thread_split()
 
-        # Get all POSSIBLE annotations
-        annotations = hoplite_db.get_all_annotations(
-            config_dict.create(eq=dict(label_type=interface.LabelType.UNCERTAIN))
+        # the current item plus the next few, whose media is rendered in the
+        # background so it is ready by the time they come up
+        items = review_queue.claim_next(
+            analyzer_db=self.get_analyzer_db(),
+            hoplite_db=hoplite_db,
+            claimed_by=self.router.session.client_token,
+            num_items=1 + PREFETCH_COUNT,
         )
 
         # Check if there are no more windows
-        if len(annotations) == 0:
+        if not items:
             self.has_more_windows = False
             self.current_window = None
+            self.current_item_id = None
+            self.current_annotation_id = None
             return
 
-        # Get the first annotation
-        annotation = annotations[0]
-        recording = hoplite_db.get_recording(annotation.recording_id)
-        windows = hoplite_db.get_all_windows(
-            filter=config_dict.create(
-                eq=dict(recording_id=recording.id),
-                approx=dict(offsets=annotation.offsets),
-            )
-        )
-
-        if len(windows) != 1:
-            raise ValueError(
-                f"Expected 1 window, got {len(windows)} with same offsets and recording id"
+        item = items[0]
+        prefetcher = self.get_window_prefetcher()
+        for next_item in items[1:]:
+            job = audio_windows.get_render_job(
+                self.config, hoplite_db, next_item.window_id
             )
+            if job is not None:
+                prefetcher.prefetch(job)
 
-        window = windows[0]
+        window = hoplite_db.get_window(item.window_id)
+        recording = hoplite_db.get_recording(item.recording_id)
 
         # Get audio and spec files
         recording_file, spec_file = audio_windows.get_audio_window_path(
-            config=self.config, hoplite_db=hoplite_db, window_id=window.id
+            config=self.config,
+            hoplite_db=hoplite_db,
+            window_id=window.id,
+            prefetcher=prefetcher,
         )
 
         # Convert to backend URLs
@@ -91,11 +99,13 @@ class AnnotateState(ConfigState):
             window_id=window.id,
             filename=recording.filename,
             offsets=window.offsets,
-            labels=[annotation.label],
+            labels=[item.label],
             spec_file=spec_url,
             audio_file=audio_url,
         )
-        self.current_target_label = annotation.label
+        self.current_item_id = item.id
+        self.current_annotation_id = item.annotation_id
+        self.current_target_label = item.label
         self.selected_labels = []
         self.label_search = ""
         self.filtered_label_suggestions = []
@@ -140,22 +150,23 @@ class AnnotateState(ConfigState):
     @rx.event
     def submit_annotations(self):
         """Submit the annotations and load next window."""
-        if not self.current_window:
+        if (
+            not self.current_window
+            or self.current_item_id is None
+            or self.current_annotation_id is None
+        ):
             return
 
         hoplite_db = self.get_hoplite_db().thread_split()
 
-        # Get the POSSIBLE annotation to remove
-        annotations = hoplite_db.get_all_annotations(
-            config_dict.create(eq=dict(label_type=interface.LabelType.UNCERTAIN))
+        # Remove the reviewed POSSIBLE annotation
+        review_queue.finish(
+            analyzer_db=self.get_analyzer_db(),
+            hoplite_db=hoplite_db,
+            review_queue_item_id=self.current_item_id,
+            annotation_id=self.current_annotation_id,
         )
 
-        if annotations:
-            # Remove the first POSSIBLE annotation
-            first_annotation = annotations[0]
-            if hoplite_db.get_annotation(first_annotation.id):
-                hoplite_db.remove_annotation(first_annotation.id)
-
         # Add new annotations with selected labels
         if self.selected_labels:
             examine_annotations.update_labels(
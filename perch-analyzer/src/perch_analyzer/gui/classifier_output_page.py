@@ -4,6 +4,7 @@ from typing import Optional
 from perch_analyzer.gui.state import ConfigState
 from perch_analyzer.db import db
 from perch_analyzer.examine import audio_windows, examine_annotations
+from perch_analyzer.classify import classifier_outputs
 from perch_hoplite.db import interface
 from pathlib import Path
 import os
@@ -33,6 +34,9 @@ class ClassifierOutputState(ConfigState):
     all_labels: list[str] = []
     filtered_labels: list[str] = []
     selected_label: Optional[str] = None
+    selected_label_summary: str = ""
+    # per-label rows a sparse classifier output did not write
+    dropped_row_counts: dict[str, int] = {}
 
     # Windows display state
     windows: list[WindowWithClassifierOutput] = []
@@ -119,6 +123,19 @@ class ClassifierOutputState(ConfigState):
         """Initialize state when component mounts."""
         self.load_classifier_output_windows()
         self.load_labels()
+        self.load_dropped_row_counts()
+
+    def load_dropped_row_counts(self):
+        """Read once per visit, they are in the footer of every part."""
+        self.dropped_row_counts = {}
+        if not self.classifier_output_id:
+            return
+        try:
+            self.dropped_row_counts = classifier_outputs.get_dropped_row_counts(
+                self.get_analyzer_db(), int(self.classifier_output_id)
+            )
+        except Exception as e:
+            logger.error(f"Error loading dropped row counts: {e}")
 
     @rx.event
     def load_labels(self):
@@ -135,12 +152,11 @@ class ClassifierOutputState(ConfigState):
         classifier_labels = set()
         if self.classifier_output_id:
             try:
-                classifier_output_windows = (
-                    analyzer_db.get_all_classifier_output_windows(
+                classifier_labels = set(
+                    analyzer_db.get_classifier_output_labels(
                         classifier_output_id=int(self.classifier_output_id)
                     )
                 )
-                classifier_labels = {cow.label for cow in classifier_output_windows}
             except Exception as e:
                 logger.error(f"Error loading classifier labels: {e}")
 
@@ -169,6 +185,54 @@ class ClassifierOutputState(ConfigState):
             self.selected_label = label
             self.editing_window_id = None
             self.filter_windows_by_label(label)
+            self.load_label_summary(label)
+
+    def load_label_summary(self, label: str):
+        """Summarize the label's logits from the classifier output aggregates.
+
+        Outputs written before aggregates existed get no summary, rather than a
+        full parquet scan on the event loop.
+        """
+        self.selected_label_summary = ""
+        if not self.classifier_output_id:
+            return
+
+        analyzer_db = self.get_analyzer_db()
+        classifier_output_id = int(self.classifier_output_id)
+        try:
+            label_aggregates = classifier_outputs.load_classifier_output_aggregates(
+                analyzer_db, classifier_output_id
+            )
+            if label_aggregates is None or label not in label_aggregates.labels:
+                # no aggregates, or an annotation label the classifier does not
+                # predict
+                return
+            num_positive = classifier_outputs.count_classifier_output_windows(
+                analyzer_db,
+                classifier_output_id,
+                label,
+                0.0,
+                float("inf"),
+                label_aggregates=label_aggregates,
+            )
+        except Exception as e:
+            logger.error(f"Error loading classifier output summary: {e}")
+            return
+
+        max_logit = "N/A"
+        _, top_logits = label_aggregates.top_windows(label, 1)
+        if len(top_logits):
+            max_logit = f"{top_logits[0]:.2f}"
+        self.selected_label_summary = (
+            f"{num_positive} windows with logit >= 0, max logit {max_logit}"
+        )
+        num_dropped = self.dropped_row_counts.get(label, 0)
+        if num_dropped:
+            # the counts above come from histograms of every window, but these
+            # rows are not in the parquet, so they cannot be gathered
+            self.selected_label_summary += (
+                f", {num_dropped} windows not written by the sparse output"
+            )
 
     @rx.event
     def filter_windows_by_label(self, label: str):
@@ -186,14 +250,23 @@ class ClassifierOutputState(ConfigState):
 
         try:
             # Get all classifier output windows for this classifier output
-            classifier_output_windows = analyzer_db.get_all_classifier_output_windows(
+            classifier_output_windows = analyzer_db.get_classifier_output_windows_frame(
                 classifier_output_id=int(self.classifier_output_id)
+            ).sort(["label", "logit"], descending=[False, True])
+
+            # render every missing window up front, in recording order
+            loader = self.get_window_audio_loader()
+            audio_windows.render_windows(
+                self.config,
+                hoplite_db,
+                classifier_output_windows["window_id"].to_list(),
+                loader=loader,
             )
 
             windows_with_metadata: list[WindowWithClassifierOutput] = []
-            for cow in classifier_output_windows:
+            for cow in classifier_output_windows.iter_rows(named=True):
                 # Get window and recording information from hoplite
-                window = hoplite_db.get_window(cow.window_id)
+                window = hoplite_db.get_window(cow["window_id"])
                 recording = hoplite_db.get_recording(window.recording_id)
 
                 # Get window labels from hoplite (same as examine page)
@@ -209,7 +282,8 @@ class ClassifierOutputState(ConfigState):
                 recording_file, spec_file = audio_windows.get_audio_window_path(
                     config=self.config,
                     hoplite_db=hoplite_db,
-                    window_id=cow.window_id,
+                    window_id=cow["window_id"],
+                    loader=loader,
                 )
 
                 # Convert absolute paths to backend URLs
@@ -227,12 +301,12 @@ class ClassifierOutputState(ConfigState):
 
                 windows_with_metadata.append(
                     WindowWithClassifierOutput(
-                        window_id=cow.window_id,
+                        window_id=cow["window_id"],
                         filename=recording.filename,
                         offsets=window.offsets,
                         ann_labels=labels_list,
-                        label=cow.label,
-                        logit=cow.logit,
+                        label=cow["label"],
+                        logit=cow["logit"],
                         spec_file=spec_url,
                         audio_file=audio_url,
                     )
@@ -570,6 +644,11 @@ def windows_panel() -> rx.Component:
             ),
             size="6",
         ),
+        rx.cond(
+            ClassifierOutputState.selected_label_summary,
+            rx.text(ClassifierOutputState.selected_label_summary, size="3"),
+            rx.fragment(),
+        ),
         rx.cond(
             ClassifierOutputState.selected_label,
             rx.cond(
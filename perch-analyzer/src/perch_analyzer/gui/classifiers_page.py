@@ -3,22 +3,17 @@ from perch_analyzer.db import db
 from .state import ConfigState
 
 
-def classifier_card(classifier: db.Classifier) -> rx.Component:
+def format_metric(value: float | None) -> str:
+    return "N/A" if value is None else f"{value:.4f}"
+
+
+def classifier_card(classifier: db.ClassifierSummary) -> rx.Component:
     """Create a card component for a single classifier."""
     formatted_date = classifier.datetime.strftime("%B %d, %Y at %I:%M %p")
 
-    # Extract metrics
-    auc_roc = classifier.metrics.get("roc_auc", "N/A")
-    cmap = classifier.metrics.get("cmap", "N/A")
-    top1_acc = classifier.metrics.get("top1_acc", "N/A")
-
-    # Format metrics with 4 decimal places if they're numeric
-    if isinstance(auc_roc, (int, float)):
-        auc_roc = f"{auc_roc:.4f}"
-    if isinstance(cmap, (int, float)):
-        cmap = f"{cmap:.4f}"
-    if isinstance(top1_acc, (int, float)):
-        top1_acc = f"{top1_acc:.4f}"
+    auc_roc = format_metric(classifier.roc_auc)
+    cmap = format_metric(classifier.cmap)
+    top1_acc = format_metric(classifier.top1_acc)
 
     return rx.box(
         rx.hstack(
@@ -71,7 +66,7 @@ def classifier_card(classifier: db.Classifier) -> rx.Component:
 def classifiers():
     """Display all trained classifiers with their metrics."""
     analyzer_db = ConfigState.get_analyzer_db()
-    all_classifiers = analyzer_db.get_all_classifiers()
+    all_classifiers = analyzer_db.get_all_classifier_summaries()
 
     if not all_classifiers:
         content = rx.vstack(
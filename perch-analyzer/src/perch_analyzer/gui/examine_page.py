@@ -124,12 +124,22 @@ class ExamineState(ConfigState):
         logger.info(f"took {dt.now() - before} to get all windows by label {label}")
 
         before = dt.now()
+        # render every missing window up front, in recording order
+        loader = self.get_window_audio_loader()
+        audio_windows.render_windows(
+            self.config,
+            hoplite_db,
+            [window_with_annotations.window.id for window_with_annotations in windows],
+            loader=loader,
+        )
+
         windows_with_metadata: list[WindowWithMetadata] = []
         for window_with_annotations in windows:
             recording_file, spec_file = audio_windows.get_audio_window_path(
                 config=self.config,
                 hoplite_db=hoplite_db,
                 window_id=window_with_annotations.window.id,
+                loader=loader,
             )
 
             labels_list = [ann.label for ann in window_with_annotations.annotations]
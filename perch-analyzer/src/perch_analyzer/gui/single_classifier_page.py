@@ -112,7 +112,7 @@ class SingleClassifierState(ConfigState):
         clf = self._get_classifier()
         if not clf:
             return NA_STR
-        auc_roc = clf.metrics.get("roc_auc")
+        auc_roc = clf.roc_auc
         if auc_roc is not None:
             return f"{auc_roc:.4f}"
         return NA_STR
@@ -123,7 +123,7 @@ class SingleClassifierState(ConfigState):
         clf = self._get_classifier()
         if not clf:
             return NA_STR
-        cmap = clf.metrics.get("cmap")
+        cmap = clf.cmap
         if cmap is not None:
             return f"{cmap:.4f}"
         return NA_STR
@@ -134,7 +134,7 @@ class SingleClassifierState(ConfigState):
         clf = self._get_classifier()
         if not clf:
             return NA_STR
-        top1_acc = clf.metrics.get("top1_acc")
+        top1_acc = clf.top1_acc
         if top1_acc is not None:
             return f"{top1_acc:.4f}"
         return NA_STR
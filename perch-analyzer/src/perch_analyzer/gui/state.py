@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 from perch_analyzer.config.config import Config
 from perch_analyzer.db import db
+from perch_analyzer.examine import prefetch, window_audio
 from perch_hoplite.db import sqlite_usearch_impl
 
 # Get data path from environment variable, fallback to "data" for backwards compatibility
@@ -52,6 +53,22 @@ class ConfigState(rx.State):
             cls._analyzer_db_instance = db.AnalyzerDB(_config)
         return cls._analyzer_db_instance
 
+    # stored on ConfigState itself rather than `cls`, so every page state shares
+    # one loader and prefetcher instead of each subclass creating its own
+    @classmethod
+    def get_window_audio_loader(cls) -> window_audio.WindowAudioLoader:
+        if not hasattr(ConfigState, "_window_audio_loader_instance"):
+            ConfigState._window_audio_loader_instance = window_audio.WindowAudioLoader()
+        return ConfigState._window_audio_loader_instance
+
+    @classmethod
+    def get_window_prefetcher(cls) -> prefetch.WindowPrefetcher:
+        if not hasattr(ConfigState, "_window_prefetcher_instance"):
+            ConfigState._window_prefetcher_instance = prefetch.WindowPrefetcher(
+                loader=cls.get_window_audio_loader()
+            )
+        return ConfigState._window_prefetcher_instance
+
     @rx.event
     def save_config_changes(self):
         """Save the editable config fields to disk."""
@@ -1,6 +1,7 @@
 import reflex as rx
 from perch_hoplite.db import interface
 from ml_collections import config_dict
+from perch_analyzer.db import hoplite_stats
 from .state import ConfigState
 
 
@@ -79,19 +80,16 @@ def summary():
 
     class_counts = hoplite_db.count_each_label()
     embedding_count = hoplite_db.count_embeddings()
-    annotation_count = len(
-        hoplite_db.get_all_annotations(
-            filter=config_dict.create(eq=dict(label_type=interface.LabelType.POSITIVE))
-        )
-    )
-    recording_count = len(hoplite_db.get_all_recordings())
+    annotation_counts = hoplite_stats.count_annotations_by_label_type(hoplite_db)
+    annotation_count = annotation_counts.get(interface.LabelType.POSITIVE, 0)
+    annotations_to_be_labeled = annotation_counts.get(interface.LabelType.UNCERTAIN, 0)
+    recording_count = hoplite_stats.count_recordings(hoplite_db)
+    windows_per_recording = hoplite_stats.windows_per_recording(hoplite_db)
 
-    target_recordings_count = analyzer_db.count_target_recordings(True)
-    unfinished_target_recordings_count = analyzer_db.count_target_recordings(False)
-    annotations_to_be_labeled = len(
-        hoplite_db.get_all_annotations(
-            filter=config_dict.create(eq=dict(label_type=interface.LabelType.UNCERTAIN))
-        )
+    target_recording_counts = analyzer_db.count_target_recordings_by_finished()
+    unfinished_target_recordings_count = target_recording_counts[False]
+    target_recordings_count = (
+        target_recording_counts[False] + target_recording_counts[True]
     )
 
     hoplite_metadata = hoplite_db.get_metadata(None)
@@ -104,6 +102,11 @@ def summary():
                 rx.heading(f"Windows: {embedding_count}", size="6"),
                 rx.heading(f"Annotations: {annotation_count}", size="6"),
                 rx.heading(f"Recordings: {recording_count}", size="6"),
+                rx.heading(
+                    f"Windows per recording: {windows_per_recording.mean_windows:.1f} "
+                    f"({windows_per_recording.min_windows}-{windows_per_recording.max_windows})",
+                    size="6",
+                ),
                 rx.heading(
                     f"Target recordings: {target_recordings_count} ({unfinished_target_recordings_count} unfinished)",
                     size="6",
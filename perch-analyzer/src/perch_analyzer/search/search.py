@@ -1,40 +1,121 @@
 from perch_hoplite.db import sqlite_usearch_impl
 from perch_analyzer.config import config
 from perch_analyzer.db import db
-from perch_hoplite.zoo import model_configs
+from perch_analyzer.search import target_embeddings
 from perch_hoplite.db import interface
+import numpy as np
 
 SEARCH_PROVENANCE = "searched_annotator"
 
+# window ids bound per query, well below sqlite's variable limit
+QUERY_CHUNK_SIZE = 10_000
+
+
+def annotated_window_labels(
+    hoplite_db: sqlite_usearch_impl.SQLiteUSearchDB,
+    window_ids: list[int],
+    labels: set[str],
+) -> set[tuple[int, str]]:
+    """Returns the (window_id, label) pairs among these that have any annotation."""
+    if not window_ids or not labels:
+        return set()
+
+    unique_window_ids = sorted(set(window_ids))
+    label_params = ", ".join("?" * len(labels))
+
+    annotated: set[tuple[int, str]] = set()
+    for start in range(0, len(unique_window_ids), QUERY_CHUNK_SIZE):
+        chunk = unique_window_ids[start : start + QUERY_CHUNK_SIZE]
+        matches = db.match_annotation_windows(
+            hoplite_db,
+            f"""
+            annotations.label IN ({label_params})
+                AND annotations.recording_id IN (
+                    SELECT recording_id FROM windows
+                    WHERE id IN ({", ".join("?" * len(chunk))})
+                )
+            """,
+            (*labels, *chunk),
+        )
+        chunk_window_ids = set(chunk)
+        annotated.update(
+            (window_id, label)
+            for _, window_id, _, label in matches
+            if window_id in chunk_window_ids
+        )
+    return annotated
+
 
 def search_using_target_recordings(
     config: config.Config,
     db: db.AnalyzerDB,
     hoplite_db: sqlite_usearch_impl.SQLiteUSearchDB,
     num_per_target_recording: int,
+    include_finished: bool = False,
 ):
-    embedding_model = model_configs.load_model_by_name(config.embedding_model)
+    target_recordings = db.get_all_target_recordings(include_finished=include_finished)
+    # results up to a target recording's depth were handled by earlier searches
+    depths = db.get_search_depths([t.id for t in target_recordings])
+    target_recordings = [
+        t for t in target_recordings if depths[t.id] < num_per_target_recording
+    ]
+    if not target_recordings:
+        return
 
-    target_recordings = db.get_all_target_recordings(include_finished=False)
+    # cached embeddings, so re-searching finished target recordings is model-free
+    embeddings, valid = target_embeddings.get_target_embeddings(db, target_recordings)
+    searched_target_recordings = [
+        target_recording
+        for target_recording, is_valid in zip(target_recordings, valid)
+        if is_valid
+    ]
+    if not searched_target_recordings:
+        return
 
-    for target_recording in target_recordings:
-        target_embedding = embedding_model.embed(target_recording.audio)
-        if target_embedding.embeddings is None:
-            continue
-        close_results = hoplite_db.ui.search(
-            target_embedding.embeddings[0, 0], num_per_target_recording
-        )
+    # a single multi-query search, one row of results per target recording
+    batch_results = hoplite_db.ui.search(embeddings[valid], num_per_target_recording)
+    # usearch returns plain Matches rather than BatchMatches for a single query
+    result_keys = np.atleast_2d(batch_results.keys)
+    result_distances = np.atleast_2d(batch_results.distances)
+    result_counts = np.atleast_1d(
+        getattr(batch_results, "counts", result_keys.shape[1])
+    )
 
-        for result in close_results:
-            window = hoplite_db.get_window(result.key)
+    # only the new tail of each target recording's results
+    results: dict[str, list] = dict(
+        target_recording_id=[], window_id=[], label=[], distance=[], rank=[]
+    )
+    for i, target_recording in enumerate(searched_target_recordings):
+        for rank in range(depths[target_recording.id], result_counts[i]):
+            results["target_recording_id"].append(target_recording.id)
+            results["window_id"].append(int(result_keys[i, rank]))
+            results["label"].append(target_recording.label)
+            results["distance"].append(float(result_distances[i, rank]))
+            results["rank"].append(rank)
 
-            hoplite_db.insert_annotation(
-                recording_id=window.recording_id,
-                offsets=window.offsets,
-                label=target_recording.label,
-                provenance=SEARCH_PROVENANCE,
-                label_type=interface.LabelType.UNCERTAIN,
-            )
-        db.set_finish_target_recording(target_recording.id, True)
+    # skip windows that already have an annotation for the label, pending or not,
+    # including ones annotated earlier in this search
+    annotated = annotated_window_labels(
+        hoplite_db, results["window_id"], set(results["label"])
+    )
+    for window_id, label in zip(results["window_id"], results["label"]):
+        if (window_id, label) in annotated:
+            continue
+        annotated.add((window_id, label))
+
+        window = hoplite_db.get_window(window_id)
+        hoplite_db.insert_annotation(
+            recording_id=window.recording_id,
+            offsets=window.offsets,
+            label=label,
+            provenance=SEARCH_PROVENANCE,
+            label_type=interface.LabelType.UNCERTAIN,
+        )
 
+    # all annotations go in one hoplite transaction, and only once they are
+    # committed are the results stored and the target recordings marked as searched
     hoplite_db.commit()
+    db.insert_search_results(**results)
+    db.set_finish_target_recordings(
+        [target_recording.id for target_recording in searched_target_recordings], True
+    )
@@ -0,0 +1,94 @@
+from perch_analyzer.db import db
+from perch_hoplite.zoo import model_configs, zoo_interface
+import numpy as np
+
+# target recordings embedded per model call
+EMBED_BATCH_SIZE = 64
+
+
+def batch_embed_target_recordings(
+    embedding_model: zoo_interface.EmbeddingModel,
+    target_recordings: list[db.TargetRecording],
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> list[np.ndarray | None]:
+    """Embeds target recordings in batches, using the first frame of each.
+
+    Clips in a batch are zero-padded at the end to the longest one, which leaves
+    the first frame untouched for clips at least a model window long. Target
+    recordings the model produced no embedding for are None.
+    """
+    embeddings: list[np.ndarray | None] = []
+    for start in range(0, len(target_recordings), batch_size):
+        batch = [
+            np.asarray(target_recording.audio, dtype=np.float32)
+            for target_recording in target_recordings[start : start + batch_size]
+        ]
+        audio_batch = np.zeros(
+            (len(batch), max(len(audio) for audio in batch)), dtype=np.float32
+        )
+        for i, audio in enumerate(batch):
+            audio_batch[i, : len(audio)] = audio
+
+        outputs = embedding_model.batch_embed(audio_batch)
+        if outputs.embeddings is None:
+            embeddings.extend([None] * len(batch))
+            continue
+        # [batch, frames, channels, dim]
+        embeddings.extend(np.asarray(outputs.embeddings[:, 0, 0], dtype=np.float32))
+
+    return embeddings
+
+
+def get_target_embeddings(
+    analyzer_db: db.AnalyzerDB,
+    target_recordings: list[db.TargetRecording],
+    embedding_model: zoo_interface.EmbeddingModel | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the embeddings of target recordings, embedding only uncached ones.
+
+    Embeddings are cached per target recording and embedding model in the analyzer
+    db. The model is only loaded if some target recording is not cached yet.
+
+    Returns ([num_target_recordings, embedding_dim] embeddings, mask of the target
+    recordings that have an embedding).
+    """
+    model_name = analyzer_db.config.embedding_model
+    cached = analyzer_db.get_target_recording_embeddings(
+        [target_recording.id for target_recording in target_recordings], model_name
+    )
+
+    uncached = [
+        target_recording
+        for target_recording in target_recordings
+        if target_recording.id not in cached
+    ]
+    if uncached:
+        if embedding_model is None:
+            embedding_model = model_configs.load_model_by_name(model_name)
+
+        new_embeddings = batch_embed_target_recordings(embedding_model, uncached)
+        embedded = [
+            (target_recording.id, embedding)
+            for target_recording, embedding in zip(uncached, new_embeddings)
+            if embedding is not None
+        ]
+        if embedded:
+            ids, embeddings = zip(*embedded)
+            analyzer_db.insert_target_recording_embeddings(
+                list(ids), model_name, np.stack(embeddings)
+            )
+            cached.update(embedded)
+
+    valid = np.array(
+        [target_recording.id in cached for target_recording in target_recordings],
+        dtype=bool,
+    )
+    if not valid.any():
+        return np.zeros((len(target_recordings), 0), dtype=np.float32), valid
+
+    embedding_dim = len(next(iter(cached.values())))
+    stacked = np.zeros((len(target_recordings), embedding_dim), dtype=np.float32)
+    for i, target_recording in enumerate(target_recordings):
+        if valid[i]:
+            stacked[i] = cached[target_recording.id]
+    return stacked, valid
@@ -5,6 +5,7 @@ from perch_analyzer.db import db
 from perch_hoplite.db import sqlite_usearch_impl
 from perch_hoplite import audio_io
 from perch_analyzer.target_recordings import audio_utils
+from perch_analyzer.search import target_embeddings
 
 # TODO: make these configs
 SAMPLE_RATE = 32000
@@ -31,6 +32,10 @@ def add_target_recording_from_file(
         label=label,
         audio=audio,
     )
+    # embed now, so searching does not have to
+    target_embeddings.get_target_embeddings(
+        db, [db.get_target_recording(target_recording_id)]
+    )
 
     return target_recording_id
 
@@ -44,14 +49,12 @@ def add_target_recording_from_xc(
 ):
     xc_ids = xenocanto.get_xc_ids(config, ebird_6_code, call_type)
 
-    # TODO: make a native db call to get the list of existing xc ids
-
     xc_ids = xc_ids[:num_recordings]
 
-    existing_targets = db.get_all_target_recordings(include_finished=True)
-    existing_xc_ids = {x.xc_id for x in existing_targets if x.xc_id is not None}
+    existing_xc_ids = db.get_all_target_recording_xc_ids(label=ebird_6_code)
+    target_recording_ids: list[int] = []
     for xc_id in xc_ids:
-        if xc_id in existing_xc_ids:
+        if int(xc_id) in existing_xc_ids:
             logging.debug(
                 f"skipping xc id {xc_id} because it is already present in database"
             )
@@ -69,9 +72,17 @@ def add_target_recording_from_xc(
         for peak in peaks:
             audio_slice = audio[peak[0] : peak[1]]
 
-            db.insert_target_recording(
-                xc_id=int(xc_id),
-                filename=None,
-                label=ebird_6_code,
-                audio=audio_slice,
+            target_recording_ids.append(
+                db.insert_target_recording(
+                    xc_id=int(xc_id),
+                    filename=None,
+                    label=ebird_6_code,
+                    audio=audio_slice,
+                )
             )
+
+    # embed now, so searching does not have to
+    if target_recording_ids:
+        target_embeddings.get_target_embeddings(
+            db, [db.get_target_recording(i) for i in target_recording_ids]
+        )
@@ -0,0 +1,54 @@
+from perch_analyzer.classify.classify import remaining_window_ids
+from perch_analyzer.db.db import ClassifierOutputPart
+import numpy as np
+
+
+def make_parts(ranges):
+    return [
+        ClassifierOutputPart(
+            id=i,
+            classifier_output_id=1,
+            start_window_id=start,
+            end_window_id=end,
+            num_windows=end - start + 1,
+            filename=f"part-{start}-{end}.parquet",
+        )
+        for i, (start, end) in enumerate(ranges)
+    ]
+
+
+def test_no_parts_leaves_every_window():
+    window_ids = np.arange(10)
+
+    np.testing.assert_array_equal(remaining_window_ids(window_ids, []), window_ids)
+
+
+def test_out_of_order_parts():
+    window_ids = np.arange(500)
+    parts = make_parts([(300, 399), (0, 99), (200, 299)])
+
+    remaining = remaining_window_ids(window_ids, parts)
+
+    np.testing.assert_array_equal(
+        remaining, np.concatenate([np.arange(100, 200), np.arange(400, 500)])
+    )
+
+
+def test_resumed_part_straddling_completed_parts():
+    # a resumed batch of 100-199 and 300-399 is recorded as one part [100, 399],
+    # spanning the part [200, 299] completed before the crash
+    window_ids = np.arange(500)
+    parts = make_parts([(0, 99), (200, 299), (100, 399)])
+
+    remaining = remaining_window_ids(window_ids, parts)
+
+    np.testing.assert_array_equal(remaining, np.arange(400, 500))
+
+
+def test_nested_parts():
+    window_ids = np.arange(100)
+    parts = make_parts([(0, 80), (10, 20), (30, 40)])
+
+    remaining = remaining_window_ids(window_ids, parts)
+
+    np.testing.assert_array_equal(remaining, np.arange(81, 100))
@@ -0,0 +1,109 @@
+from datetime import datetime as dt
+from perch_analyzer.examine import spectrogram
+import numpy as np
+import pytest
+import struct
+import zlib
+
+NUM_WINDOWS = 20
+FRAMES = 500
+MEL_BINS = 160
+FRAME_RATE_HZ = 100
+
+
+@pytest.fixture
+def melspecs():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(NUM_WINDOWS, FRAMES, MEL_BINS)).astype(np.float32)
+
+
+def decode_png(png: bytes) -> np.ndarray:
+    """Decodes the unfiltered grayscale PNGs that spectrogram.encode_png writes."""
+    assert png.startswith(spectrogram.PNG_SIGNATURE)
+    chunks = {}
+    pos = len(spectrogram.PNG_SIGNATURE)
+    while pos < len(png):
+        (length,) = struct.unpack(">I", png[pos : pos + 4])
+        chunk_type = png[pos + 4 : pos + 8]
+        data = png[pos + 8 : pos + 8 + length]
+        (crc,) = struct.unpack(">I", png[pos + 8 + length : pos + 12 + length])
+        assert crc == zlib.crc32(chunk_type + data)
+        chunks[chunk_type] = data
+        pos += 12 + length
+
+    width, height = struct.unpack(">II", chunks[b"IHDR"][:8])
+    scanlines = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8)
+    scanlines = scanlines.reshape(height, width + 1)
+    assert (scanlines[:, 0] == 0).all()
+    return scanlines[:, 1:]
+
+
+def write_with_specshow(melspec, path):
+    """The matplotlib render that audio_windows used before spectrogram."""
+    librosa_display = pytest.importorskip("librosa.display")
+    plt = pytest.importorskip("matplotlib.pyplot")
+
+    fig = plt.figure(figsize=(6.4, 4.8))
+    librosa_display.specshow(
+        melspec.T,
+        sr=FRAME_RATE_HZ * 320,
+        y_axis="mel",
+        x_axis="time",
+        hop_length=320,
+        cmap="Greys",
+    )
+    plt.savefig(path)
+    plt.close(fig)
+
+
+def test_render_round_trips_pixels(melspecs):
+    (png,) = spectrogram.render_spectrograms(melspecs[:1], FRAME_RATE_HZ)
+
+    pixels = decode_png(png)
+
+    np.testing.assert_array_equal(pixels, spectrogram.to_pixels(melspecs[:1])[0])
+    assert pixels.shape == (MEL_BINS, FRAMES)
+    assert pixels.min() == 0 and pixels.max() == 255
+
+
+def test_low_frequencies_at_bottom():
+    melspec = np.zeros((10, 4), dtype=np.float32)
+    melspec[:, 0] = 1.0
+
+    pixels = spectrogram.to_pixels(melspec[None])[0]
+
+    # loud low mel bin is dark and drawn on the bottom row
+    assert (pixels[-1] == 0).all()
+    assert (pixels[:-1] == 255).all()
+
+
+def test_axes_and_scale(melspecs):
+    (png,) = spectrogram.render_spectrograms(
+        melspecs[:1], FRAME_RATE_HZ, axes=True, scale=2
+    )
+
+    pixels = decode_png(png)
+
+    assert pixels.shape == (MEL_BINS * 2, FRAMES * 2)
+    ticks = np.arange(0, FRAMES * 2, FRAME_RATE_HZ * 2)
+    tick_pixels = pixels[-spectrogram.TICK_LENGTH_PX :, ticks]
+    assert (tick_pixels == spectrogram.TICK_VALUE).all()
+
+
+@pytest.mark.benchmark
+def test_render_benchmark(melspecs, tmp_path, record_property):
+    before = dt.now()
+    for i, melspec in enumerate(melspecs):
+        write_with_specshow(melspec, tmp_path / f"specshow_{i}.png")
+    record_property("specshow_s", (dt.now() - before).total_seconds())
+
+    before = dt.now()
+    for i, melspec in enumerate(melspecs):
+        spectrogram.write_spectrogram(
+            melspec, tmp_path / f"render_{i}.png", FRAME_RATE_HZ, axes=True, scale=2
+        )
+    record_property("render_s", (dt.now() - before).total_seconds())
+
+    before = dt.now()
+    spectrogram.render_spectrograms(melspecs, FRAME_RATE_HZ, axes=True, scale=2)
+    record_property("batched_render_s", (dt.now() - before).total_seconds())
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+from perch_analyzer.examine import window_audio
+import numpy as np
+import pytest
+import soundfile
+
+FILE_SAMPLE_RATE = 48000
+SAMPLE_RATE = 32000
+DURATION_S = 120.0
+WINDOW_SIZE_S = 5.0
+
+
+@pytest.fixture
+def recording_path(tmp_path):
+    path = tmp_path / "recording.wav"
+    t = np.arange(int(DURATION_S * FILE_SAMPLE_RATE)) / FILE_SAMPLE_RATE
+    # a slow sweep, so slices from the wrong offset do not match
+    audio = 0.5 * np.sin(2 * np.pi * (200 + 10 * t) * t)
+    soundfile.write(path, audio.astype(np.float32), FILE_SAMPLE_RATE)
+    return str(path)
+
+
+def load_window_directly(path, offset_s):
+    """Reads and resamples a single window, like audio_io does per window."""
+    with soundfile.SoundFile(path) as f:
+        f.seek(int(offset_s * FILE_SAMPLE_RATE))
+        audio = f.read(int(WINDOW_SIZE_S * FILE_SAMPLE_RATE), dtype="float32")
+    return window_audio.resample(audio, FILE_SAMPLE_RATE, SAMPLE_RATE)
+
+
+def test_windows_match_direct_reads(recording_path):
+    # unsorted, across chunk edges and one cut short by the end of the file
+    offsets = [60.0, 7.5, 0.0, 118.0, 55.0, 9.0]
+
+    with window_audio.WindowAudioLoader() as loader:
+        windows = loader.load_windows(
+            [(recording_path, offset) for offset in offsets],
+            WINDOW_SIZE_S,
+            SAMPLE_RATE,
+        )
+
+    for offset, window in zip(offsets, windows):
+        expected = load_window_directly(recording_path, offset)
+        assert len(window) == len(expected)
+        # away from the edges of a direct read, where its resampling filter has no
+        # context, the samples agree
+        np.testing.assert_allclose(window[100:-100], expected[100:-100], atol=1e-3)
+
+
+def test_chunks_are_cached(recording_path):
+    loader = window_audio.WindowAudioLoader(max_cached_chunks=4)
+
+    first = loader.load_window(recording_path, 17.5, WINDOW_SIZE_S, SAMPLE_RATE)
+    assert len(loader._chunks) == 2
+    assert len(loader._files) == 1
+
+    second = loader.load_window(recording_path, 17.5, WINDOW_SIZE_S, SAMPLE_RATE)
+    np.testing.assert_array_equal(first, second)
+
+    loader.load_windows(
+        [(recording_path, offset) for offset in range(0, 100, 10)],
+        WINDOW_SIZE_S,
+        SAMPLE_RATE,
+    )
+    assert len(loader._chunks) == 4
+    loader.close()
+
+
+def test_concurrent_loads_decode_each_chunk_once(recording_path, monkeypatch):
+    loader = window_audio.WindowAudioLoader()
+    decoded = []
+    decode_run = loader._decode_run
+
+    def counting_decode_run(path, sample_rate, first, last):
+        decoded.extend(range(first, last + 1))
+        return decode_run(path, sample_rate, first, last)
+
+    monkeypatch.setattr(loader, "_decode_run", counting_decode_run)
+
+    requests = [(recording_path, float(offset)) for offset in range(0, 110, 5)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(
+                lambda _: loader.load_windows(requests, WINDOW_SIZE_S, SAMPLE_RATE),
+                range(8),
+            )
+        )
+
+    assert sorted(decoded) == sorted(set(decoded))
+    for windows in results[1:]:
+        for window, expected in zip(windows, results[0]):
+            np.testing.assert_array_equal(window, expected)
+    loader.close()
@@ -0,0 +1,131 @@
+from datetime import datetime as dt
+from ml_collections import config_dict
+from perch_hoplite.db import sqlite_usearch_impl
+from perch_analyzer.classify.window_metadata import WindowFilenameJoiner
+import numpy as np
+import pytest
+
+EMBEDDING_DIM = 8
+NUM_RECORDINGS = 50
+WINDOWS_PER_RECORDING = 200
+WINDOW_SIZE_S = 5.0
+
+
+@pytest.fixture
+def hoplite_db(tmp_path):
+    db = sqlite_usearch_impl.SQLiteUSearchDB.create(
+        str(tmp_path / "hoplite"),
+        sqlite_usearch_impl.get_default_usearch_config(EMBEDDING_DIM),
+    )
+    deployment_id = db.insert_deployment(name="test", project="test")
+    rng = np.random.default_rng(0)
+    for i in range(NUM_RECORDINGS):
+        recording_id = db.insert_recording(
+            filename=f"recording_{i}.wav", deployment_id=deployment_id
+        )
+        for j in range(WINDOWS_PER_RECORDING):
+            db.insert_window(
+                recording_id=recording_id,
+                offsets=np.array([j * WINDOW_SIZE_S, (j + 1) * WINDOW_SIZE_S]),
+                embedding=rng.normal(size=EMBEDDING_DIM).astype(np.float32),
+            )
+    db.commit()
+    return db
+
+
+def join_with_orm(hoplite_db, window_ids):
+    """The per-window lookup that classify used before the bulk join."""
+    windows = hoplite_db.get_all_windows(
+        filter=config_dict.create(isin=dict(id=[int(x) for x in window_ids]))
+    )
+    recording_id_to_filename: dict[int, str] = {}
+    for recording_id in {window.recording_id for window in windows}:
+        recording_id_to_filename[recording_id] = hoplite_db.get_recording(
+            recording_id
+        ).filename
+
+    windows_by_id = {window.id: window for window in windows}
+    filenames = [
+        recording_id_to_filename[windows_by_id[w].recording_id] for w in window_ids
+    ]
+    offsets = [float(windows_by_id[w].offsets[0]) for w in window_ids]
+    return np.array(filenames, dtype=object), np.array(offsets, dtype=np.float32)
+
+
+def test_bulk_join_matches_orm_lookup(hoplite_db):
+    window_ids = np.array(hoplite_db.match_window_ids())
+    batch = window_ids[::3]
+
+    expected_filenames, expected_offsets = join_with_orm(hoplite_db, batch)
+    filenames, offsets = WindowFilenameJoiner(hoplite_db).join(batch)
+
+    np.testing.assert_array_equal(filenames, expected_filenames)
+    np.testing.assert_allclose(offsets, expected_offsets)
+
+
+def test_bulk_join_refreshes_new_recordings(hoplite_db):
+    joiner = WindowFilenameJoiner(hoplite_db)
+
+    recording_id = hoplite_db.insert_recording(filename="late.wav")
+    window_id = hoplite_db.insert_window(
+        recording_id=recording_id,
+        offsets=np.array([10.0, 15.0]),
+        embedding=np.zeros(EMBEDDING_DIM, dtype=np.float32),
+    )
+    hoplite_db.commit()
+
+    filenames, offsets = joiner.join(np.array([window_id]))
+
+    assert filenames.tolist() == ["late.wav"]
+    assert offsets.tolist() == [10.0]
+
+
+class CountingCursor:
+    """Delegates to a sqlite cursor, counting the queries executed through it."""
+
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        self._counter["queries"] += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@pytest.fixture
+def query_counter(hoplite_db, monkeypatch):
+    counter = {"queries": 0}
+    get_cursor = hoplite_db._get_cursor
+    monkeypatch.setattr(
+        hoplite_db, "_get_cursor", lambda: CountingCursor(get_cursor(), counter)
+    )
+    return counter
+
+
+def test_bulk_join_is_one_query_per_batch(hoplite_db, query_counter):
+    window_ids = np.array(hoplite_db.match_window_ids())
+    joiner = WindowFilenameJoiner(hoplite_db)
+    assert query_counter["queries"] == 1
+
+    batches = np.array_split(window_ids, 10)
+    for batch in batches:
+        joiner.join(batch)
+
+    # the recording table is loaded once, then one windows query per batch
+    assert query_counter["queries"] == 1 + len(batches)
+
+
+@pytest.mark.benchmark
+def test_bulk_join_benchmark(hoplite_db, record_property):
+    window_ids = np.array(hoplite_db.match_window_ids())
+
+    before = dt.now()
+    join_with_orm(hoplite_db, window_ids)
+    record_property("orm_lookup_s", (dt.now() - before).total_seconds())
+
+    before = dt.now()
+    WindowFilenameJoiner(hoplite_db).join(window_ids)
+    record_property("bulk_join_s", (dt.now() - before).total_seconds())